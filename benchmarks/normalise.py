@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Benchmark of LSDB normalisation, single-pass normalise_path() against the previous approach of
+round-tripping the whole table through JSON once per rewrite
+
+Examples:
+    $ cd orbweaver && PYTHONPATH=. python3 ../benchmarks/normalise.py --copies 200
+"""
+import argparse
+import copy
+import timeit
+from json import loads, dumps
+from os.path import dirname, join
+import yaml
+from bgp_ls_vis.records import GAPI_TYPE_REPLACE_LOOKUP, normalise_path
+
+FIXTURE = join(dirname(__file__), "..", "tests", "18-node-isis-w-bcast-segment.yaml")
+
+
+def load_b_rib(filename: str, copies: int) -> list:
+    """Loads best paths from a YAML dump of the BGP-LS table, repeated to make a bigger table"""
+    table = yaml.load(open(filename, "r"), Loader=yaml.Loader)
+    b_rib = [path for route in table for path in route["destination"]["paths"] if path["best"]]
+    return [copy.deepcopy(path) for _ in range(copies) for path in b_rib]
+
+
+def legacy_normalise(b_rib: list) -> list:
+    """The JSON round-trip normalisation GoBGPQueryWrapper.get_lsdb() used before normalise_path()"""
+
+    def replace_kv_in_dict(t_dict, item_to_be_replaced, replaced_with):
+        return loads(dumps(t_dict).replace(f'"{item_to_be_replaced}"', f'"{replaced_with}"'))
+
+    new_table = loads(dumps(b_rib))
+    new_table = replace_kv_in_dict(new_table, "@type", "type")
+    for old_key, new_key in GAPI_TYPE_REPLACE_LOOKUP.items():
+        new_table = replace_kv_in_dict(new_table, old_key, new_key)
+
+    for path in new_table:
+        pattrs_flat = {}
+        for pattr in path.get("pattrs", []):
+            pattrs_flat[pattr["type"]] = {}
+            for key, value in pattr.items():
+                if key != "type":
+                    pattrs_flat[pattr["type"]][key] = value
+        path["pattrs"] = pattrs_flat
+
+    for path in new_table:
+        ls_attribute = path["pattrs"].get("LsAttribute", {})
+        if path["nlri"]["nlri"]["type"] == "LsLinkNLRI":
+            path["igpMetric"] = ls_attribute.get("link", {}).get("igpMetric")
+        if path["nlri"]["nlri"]["type"] == "LsNodeNLRI":
+            path["name"] = ls_attribute.get("node", {}).get(
+                "name", path["nlri"]["nlri"]["localNode"]["igpRouterId"]
+            )
+    return new_table
+
+
+def main():
+    """Entrypoint when ran as a script"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filename", default=FIXTURE, help="YAML dump of a BGP-LS table")
+    parser.add_argument("--copies", type=int, default=100, help="Times to repeat the table")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing runs, best is reported")
+    args = parser.parse_args()
+
+    b_rib = load_b_rib(args.filename, args.copies)
+    if legacy_normalise(b_rib) != [normalise_path(path) for path in b_rib]:
+        raise SystemExit("normalise_path() output differs from the legacy normalisation")
+
+    for name, func in (
+        ("legacy", lambda: legacy_normalise(b_rib)),
+        ("single-pass", lambda: [normalise_path(path) for path in b_rib]),
+    ):
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print(f"{name:>12}: {best * 1000:9.1f} ms for {len(b_rib)} paths")
+
+
+if __name__ == "__main__":
+    main()
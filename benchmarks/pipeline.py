@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""Benchmark of a full refresh of synthetic BGP-LS tables, phase by phase, for time and memory
+
+Phases, each fed the output of the previous one:
+    decode: records.LSA from gobgp.Destination messages, as get_lsdb() does while streaming
+    graph: GraphUpdater.update() of an empty graph and the Snapshot built from it
+    csr: Array-backed copy of the graph path computations run on
+    spf: Shortest path trees from --sources random routers, by IGP metric
+    /nx, /lsdb, /hosts: Serializing each endpoint's cached body
+    columnar: Serializing /nx?format=columnar, with every column
+
+Memory is measured by tracemalloc in a separate, slower run. "peak" is the most allocated at
+once during the phase, "kept" what is still allocated once it returns, both in MB.
+
+Examples:
+    $ cd orbweaver && PYTHONPATH=. python3 ../benchmarks/pipeline.py --nodes 1000 10000
+    $ cd orbweaver && PYTHONPATH=. python3 ../benchmarks/pipeline.py --filename ../tests/18-node-isis-w-bcast-segment.yaml
+"""
+import argparse
+import json
+import random
+import timeit
+import tracemalloc
+from typing import Callable, Tuple
+import yaml
+from google.protobuf.json_format import ParseDict
+from bgp_ls_vis import csr
+from bgp_ls_vis import gobgp_pb2 as gobgp
+from bgp_ls_vis.graphing import LINK_WEIGHTS, GraphUpdater, columnar_graph, graph_to_dict
+from bgp_ls_vis.proto import lsas_from_destination
+from bgp_ls_vis.responses import CachedBody
+from bgp_ls_vis.snapshot import Snapshot
+from bgp_ls_vis.spf import ShortestPathTree
+import topologies
+
+MB = 1024 * 1024
+
+
+def measure(func: Callable, repeat: int, memory: bool) -> Tuple[float, object, int, int]:
+    """Times func, best of repeat runs, then runs it once more under tracemalloc if memory
+
+    Returns:
+        Tuple of (seconds, result, peak bytes, kept bytes), bytes are 0 without memory
+    """
+    seconds = min(timeit.repeat(func, number=1, repeat=repeat))
+    if not memory:
+        return seconds, func(), 0, 0
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = func()
+    kept, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, result, peak - before, kept - before
+
+
+def run(name: str, table: list, args) -> list:
+    """Runs every phase against a table, prints and returns a row per phase"""
+    destinations = [ParseDict(route["destination"], gobgp.Destination()) for route in table]
+    rows = []
+
+    def phase(phase_name: str, func: Callable, items: int = None, unit: str = None):
+        seconds, result, peak, kept = measure(func, args.repeat, args.memory)
+        if items is None:
+            items, unit = len(result), "B"
+        rows.append(
+            {
+                "table": name,
+                "phase": phase_name,
+                "seconds": seconds,
+                "throughput": items / seconds,
+                "unit": unit,
+                "peak_mb": peak / MB,
+                "kept_mb": kept / MB,
+            }
+        )
+        if unit == "B":
+            throughput = f"{items / seconds / MB:9.1f} MB/s"
+        else:
+            throughput = f"{items / seconds:9.0f} {unit}/s"
+        print(
+            f"{name:>16} {phase_name:>7}: {seconds * 1000:9.1f} ms {throughput:>17}"
+            + (f" {peak / MB:8.1f} MB peak {kept / MB:8.1f} MB kept" if args.memory else "")
+        )
+        return result
+
+    lsdb = phase(
+        "decode",
+        lambda: [
+            lsa for destination in destinations for lsa in lsas_from_destination(destination, True)
+        ],
+        len(destinations),
+        "paths",
+    )
+
+    def build() -> Snapshot:
+        updater = GraphUpdater()
+        changes = updater.update(lsdb)
+        return Snapshot(1, updater.lsdb, updater.graph.copy(), changes)
+
+    snapshot = phase("graph", build, len(lsdb), "LSAs")
+    topology = phase(
+        "csr",
+        lambda: csr.CSRGraph(snapshot.graph, LINK_WEIGHTS),
+        snapshot.graph.number_of_edges(),
+        "links",
+    )
+    sources = random.Random(0).sample(snapshot.hosts, min(args.sources, len(snapshot.hosts)))
+    phase(
+        "spf",
+        lambda: [ShortestPathTree.from_csr(topology, source, "igpMetric") for source in sources],
+        len(sources),
+        "trees",
+    )
+    for route, producer in (
+        ("/nx", lambda: graph_to_dict(snapshot.graph)),
+        ("/lsdb", lambda: [lsa.to_dict() for lsa in snapshot.lsdb]),
+        ("/hosts", lambda: list(snapshot.hosts)),
+        ("columnar", lambda: columnar_graph(snapshot.graph)),
+    ):
+        phase(route, lambda producer=producer: CachedBody.json(producer(), 1).body)
+    return rows
+
+
+def main():
+    """Entrypoint when ran as a script"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--shapes",
+        nargs="+",
+        choices=topologies.SHAPES,
+        default=list(topologies.SHAPES),
+        help="Synthetic topologies to generate",
+    )
+    parser.add_argument(
+        "--nodes", nargs="+", type=int, default=[100, 1000, 10000], help="Sizes to generate"
+    )
+    parser.add_argument("--filename", help="YAML dump of a BGP-LS table, instead of generating")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing runs, best is reported")
+    parser.add_argument("--sources", type=int, default=10, help="Shortest path trees to compute")
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="Skip tracemalloc")
+    parser.add_argument("--json", help="Also write every result to this file, for comparisons")
+    args = parser.parse_args()
+
+    rows = []
+    if args.filename:
+        table = yaml.load(open(args.filename, "r"), Loader=yaml.Loader)
+        rows.extend(run(args.filename.rsplit("/", 1)[-1], json.loads(json.dumps(table)), args))
+    else:
+        for shape in args.shapes:
+            for nodes in args.nodes:
+                topology = topologies.SHAPES[shape](nodes)
+                table = topologies.bgp_ls_table(topology)
+                rows.extend(run(f"{shape}-{len(topology[0])}", table, args))
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(rows, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""Synthetic BGP-LS tables of arbitrary size, in the shape of a YAML dump of the real thing
+
+Tables are lists of {"destination": ...} as GoBGPQueryWrapper.debug() returns them, so a dump
+loads with GoBGPQueryWrapper.get_lsdb(filename=...) exactly like
+tests/18-node-isis-w-bcast-segment.yaml does. Every router advertises a node NLRI and its
+loopback as a prefix NLRI, and every adjacency a link NLRI in each direction.
+
+Examples:
+    $ python3 benchmarks/topologies.py isp 10000 > /tmp/isp-10k.yaml
+"""
+import argparse
+import ipaddress
+import math
+import random
+import sys
+from typing import Callable, Dict, List, Tuple
+import yaml
+
+ASN = 65001
+ROUTE_ATTRS = {
+    "age": "2021-01-11T13:21:42Z",
+    "best": True,
+    "family": {"afi": "AFI_LS", "safi": "SAFI_LS"},
+    "neighborIp": "10.255.255.2",
+    "sourceAsn": ASN,
+    "sourceId": "10.255.255.2",
+}
+GOBGPAPI = "type.googleapis.com/gobgpapi."
+BANDWIDTHS = (1.25e9, 12.5e9, 50e9)  # 10G, 100G and 400G, in bytes per second
+
+# A topology is a list of router names, and a list of (local, remote, igp_metric, bandwidth)
+# adjacencies between their positions in that list
+Topology = Tuple[List[str], List[Tuple[int, int, int, float]]]
+
+
+def fat_tree(nodes: int, radix: int = 8) -> Topology:
+    """Three-tier Clos of pods, each of radix / 2 edge and radix / 2 aggregation switches
+
+    Aggregation switch i of every pod connects to each of the radix / 2 spines of plane i. Pods
+    are added until there are at least `nodes` switches, so unlike a textbook k-ary fat-tree
+    spines get more ports as the fabric grows rather than the other way around.
+    """
+    half = radix // 2
+    names = [f"spine{plane}-{i}" for plane in range(half) for i in range(half)]
+    links = []
+    for pod in range((max(nodes - len(names), 0) + radix - 1) // radix or 1):
+        aggregation = [len(names) + i for i in range(half)]
+        names.extend(f"pod{pod}-agg{i}" for i in range(half))
+        edge = [len(names) + i for i in range(half)]
+        names.extend(f"pod{pod}-edge{i}" for i in range(half))
+        for plane, agg in enumerate(aggregation):
+            links.extend((agg, plane * half + i, 10, BANDWIDTHS[2]) for i in range(half))
+            links.extend((agg, leaf, 10, BANDWIDTHS[1]) for leaf in edge)
+    return names, links
+
+
+def ring(nodes: int) -> Topology:
+    """Single ring, the worst case for SPF depth"""
+    names = [f"r{i}" for i in range(max(nodes, 3))]
+    return names, [(i, (i + 1) % len(names), 10, BANDWIDTHS[1]) for i in range(len(names))]
+
+
+def isp(nodes: int, seed: int = 0) -> Topology:
+    """ISP: a meshed core, aggregation routers dual-homed to it and access routers dual-homed
+    to a pair of aggregation routers, with uneven metrics"""
+    rand = random.Random(seed)
+    core = max(4, round(math.sqrt(nodes) / 2))
+    aggregation = max(2, (nodes - core) // 16)
+    access = max(nodes - core - aggregation, 0)
+    names = [f"core{i}" for i in range(core)]
+    names.extend(f"agg{i}" for i in range(aggregation))
+    names.extend(f"acc{i}" for i in range(access))
+
+    # Core ring, plus a chord to the opposite side and a random one from every core router
+    pairs = set()
+    for i in range(core):
+        for j in ((i + 1) % core, (i + core // 2) % core, rand.randrange(core)):
+            if i != j:
+                pairs.add((min(i, j), max(i, j)))
+    links = [(i, j, rand.choice((5, 10, 20)), BANDWIDTHS[2]) for i, j in sorted(pairs)]
+    for i in range(aggregation):
+        agg = core + i
+        for j in (i % core, (i + 1) % core):
+            links.append((agg, j, rand.choice((10, 20, 50)), BANDWIDTHS[1]))
+    for i in range(access):
+        # Runs of 8 access routers share the same pair
+        first = (i // 8) % aggregation
+        for j in (first, (first + 1) % aggregation):
+            links.append((core + aggregation + i, core + j, 100, BANDWIDTHS[0]))
+    return names, links
+
+
+SHAPES: Dict[str, Callable[[int], Topology]] = {"fat-tree": fat_tree, "ring": ring, "isp": isp}
+
+
+def router_id(index: int) -> str:
+    """IS-IS system ID of a router"""
+    digits = f"{index + 1:012x}"
+    return f"{digits[0:4]}.{digits[4:8]}.{digits[8:12]}"
+
+
+def _destination(prefix: str, nlri_type: str, nlri: dict, ls_attribute: dict) -> dict:
+    """One BGP-LS destination of a single best path, as GoBGPQueryWrapper.debug() dumps it"""
+    path = {
+        "nlri": {
+            "@type": GOBGPAPI + "LsAddrPrefix",
+            "type": nlri_type,
+            "nlri": nlri,
+            "protocolId": "LS_PROTOCOL_ISIS_L2",
+        },
+        "pattrs": [
+            {"@type": GOBGPAPI + "OriginAttribute"},
+            {"@type": GOBGPAPI + "LocalPrefAttribute", "localPref": 100},
+            {"@type": GOBGPAPI + "LsAttribute", **ls_attribute},
+        ],
+        **ROUTE_ATTRS,
+    }
+    return {"destination": {"paths": [path], "prefix": prefix}}
+
+
+def bgp_ls_table(topology: Topology) -> list:
+    """Builds the BGP-LS table advertising a topology
+
+    Args:
+        topology: As returned by one of SHAPES
+
+    Returns:
+        List of {"destination": ...}, see the module docstring
+    """
+    names, links = topology
+    ids = [router_id(i) for i in range(len(names))]
+    table = []
+    for i, name in enumerate(names):
+        loopback = str(ipaddress.IPv4Address("10.0.0.0") + i)
+        local_node = {"asn": ASN, "igpRouterId": ids[i]}
+        table.append(
+            _destination(
+                f"NLRI {{ NODE {{ {ids[i]} }} }}",
+                "LS_NLRI_NODE",
+                {"@type": GOBGPAPI + "LsNodeNLRI", "localNode": local_node},
+                {"node": {"name": name, "localRouterId": loopback}},
+            )
+        )
+        table.append(
+            _destination(
+                f"NLRI {{ PREFIXv4 {{ LOCAL_NODE: {ids[i]} PREFIX: [{loopback}/32] }} }}",
+                "LS_NLRI_PREFIX_V4",
+                {
+                    "@type": GOBGPAPI + "LsPrefixV4NLRI",
+                    "localNode": local_node,
+                    "prefixDescriptor": {"ipReachability": [f"{loopback}/32"]},
+                },
+                {},
+            )
+        )
+    # Each adjacency gets a /31 out of 100.64.0.0/10
+    subnet = ipaddress.IPv4Address("100.64.0.0")
+    for n, (local, remote, igp_metric, bandwidth) in enumerate(links):
+        addresses = (str(subnet + 2 * n), str(subnet + 2 * n + 1))
+        for (a, b), (address, neighbor) in (
+            ((local, remote), addresses),
+            ((remote, local), addresses[::-1]),
+        ):
+            table.append(
+                _destination(
+                    f"NLRI {{ LINK {{ LOCAL_NODE: {ids[a]} REMOTE_NODE: {ids[b]} "
+                    f"LINK: {address}->{neighbor}}} }}",
+                    "LS_NLRI_LINK",
+                    {
+                        "@type": GOBGPAPI + "LsLinkNLRI",
+                        "localNode": {"asn": ASN, "igpRouterId": ids[a]},
+                        "remoteNode": {"asn": ASN, "igpRouterId": ids[b]},
+                        "linkDescriptor": {
+                            "interfaceAddrIpv4": address,
+                            "neighborAddrIpv4": neighbor,
+                        },
+                    },
+                    {"link": {"igpMetric": igp_metric, "bandwidth": bandwidth}},
+                )
+            )
+    return table
+
+
+def main():
+    """Entrypoint when ran as a script, dumps a table as YAML to stdout"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("shape", choices=SHAPES)
+    parser.add_argument("nodes", type=int, help="Number of routers, at least")
+    args = parser.parse_args()
+
+    yaml.dump(
+        bgp_ls_table(SHAPES[args.shape](args.nodes)),
+        sys.stdout,
+        Dumper=getattr(yaml, "CSafeDumper", yaml.SafeDumper),
+        sort_keys=False,
+    )
+
+
+if __name__ == "__main__":
+    main()
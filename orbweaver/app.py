@@ -1,10 +1,30 @@
 #!/usr/bin/env python3
 """Orbweaver, Flask RESTful frontend for GoBGP"""
+
+import json
 import sys
+import time
+from os import environ
 from os.path import isfile
-from flask import Flask, render_template, jsonify, make_response
+from typing import Callable, Optional, Tuple
+from flask import Flask, Response, g, render_template, jsonify, make_response, request
+import networkx
 import yaml
 from bgp_ls_vis.lsm import LinkStateManager
+from bgp_ls_vis import diagnostics
+from bgp_ls_vis import history
+from bgp_ls_vis import metrics
+from bgp_ls_vis.responses import (
+    ARROW,
+    INSTANCE_ID,
+    JSON,
+    CachedBody,
+    etag_matches,
+    negotiate_encoding,
+    negotiate_format,
+)
+from bgp_ls_vis.graphing import LINK_COLUMNS, LINK_WEIGHTS, NODE_COLUMNS
+from bgp_ls_vis.snapshot import Snapshot
 
 CONF = (
     yaml.safe_load(open("config.yaml", "r"))
@@ -12,24 +32,134 @@ CONF = (
     else sys.exit("Config.yaml not found. Exiting.")
 )
 
+diagnostics.configure(
+    level=CONF.get("log_level", "INFO"),
+    lsdb_dump_file=CONF.get("lsdb_dump_file"),
+)
 
 app = Flask(__name__)
-LSM = LinkStateManager(
-    target_ipv4_address=CONF["gobgp_grpc_ip"],
-    target_port=CONF["gobgp_grpc_port"],
-    polling_period=CONF["update_interval"],
-)
+# Under gunicorn (see gunicorn.conf.py), a separate collector process queries GoBGP and workers
+# follow the snapshots it publishes
+LSM = LinkStateManager.from_config(CONF, collect=not environ.get("ORBWEAVER_WORKER"))
+# Each of the k paths takes up to one shortest path computation per node on the one before
+MAX_K_PATHS = CONF.get("max_k_paths") or 16
+
+
+def route_label() -> str:
+    """The route rule of the current request, as a metrics label of bounded cardinality"""
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+
+@app.before_request
+def start_request_timer():
+    """Notes when the request started, see observe_request()"""
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def observe_request(response: Response) -> Response:
+    """Records how long the request took, until the response starts, and flags responses served
+    from a stored snapshot while GoBGP hasn't been heard from yet"""
+    metrics.REQUEST_SECONDS.labels(request.method, route_label(), response.status_code).observe(
+        time.perf_counter() - g.request_started
+    )
+    if LSM.snapshot.stale:
+        response.headers["Warning"] = '110 - "Response is Stale"'
+    return response
+
+
+def cached_response(name: str, producer: Callable[..., CachedBody], snapshot=None):
+    """Responds with a body serialized at most once per snapshot generation
+
+    Honours If-None-Match against the generation's ETag and compresses according to
+    Accept-Encoding, each variant also being compressed at most once per generation.
+
+    Args:
+        name: Unique name of the body within a snapshot
+        producer: Called with the current snapshot to serialize the body, when not yet cached
+        snapshot: Snapshot to respond from, defaults to the current one
+    """
+
+    def produce(snapshot) -> CachedBody:
+        with metrics.SERIALIZE_SECONDS.labels(route_label()).time():
+            return producer(snapshot)
+
+    body: CachedBody = (snapshot or LSM.snapshot).cached(name, produce)
+    headers = {"ETag": body.etag, "Vary": "Accept, Accept-Encoding"}
+    if etag_matches(request.headers.get("If-None-Match", ""), body.etag):
+        return make_response("", 304, headers)
+
+    encoding = negotiate_encoding(request.headers.get("Accept-Encoding", ""))
+    headers["Content-Type"] = body.mimetype
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return make_response(body.encoded(encoding), 200, headers)
+
+
+def negotiated_response(name: str, producer: Callable, snapshot=None, tables: bool = False):
+    """Responds with a value in the format the client prefers, see negotiate_format(), serialized
+    at most once per snapshot generation and format like cached_response() does
+
+    Args:
+        name: Unique name of the value within a snapshot
+        producer: Called with the snapshot to build the value, JSON-serializable
+        snapshot: Snapshot to respond from, defaults to the current one
+        tables: Whether the graph can be responded with as a table, in which case an Arrow IPC
+            stream of its ?table= (nodes or links, the default) can be negotiated
+    """
+    mimetype = negotiate_format(request.accept_mimetypes, tables)
+    if mimetype == ARROW:
+        table = request.args.get("table", "links")
+        if table not in ("nodes", "links"):
+            return make_response(jsonify({"error": "table must be nodes or links"}), 400)
+        return cached_response(
+            f"{name};{table};{ARROW}",
+            lambda snapshot: CachedBody.arrow(
+                LSM.get_graph_table(table, snapshot), snapshot.generation
+            ),
+            snapshot,
+        )
+    return cached_response(
+        name if mimetype == JSON else f"{name};{mimetype}",
+        lambda snapshot: CachedBody.serialize(producer(snapshot), mimetype, snapshot.generation),
+        snapshot,
+    )
+
+
+def requested_snapshot() -> Tuple[Optional[Snapshot], Optional[Response]]:
+    """The snapshot to respond from, the one current at ?at=<time> if given, see
+    LinkStateManager.snapshot_at()
+
+    Returns:
+        Tuple of (snapshot, None), or of (None, error response) when at can't be answered
+    """
+    at = request.args.get("at")
+    if at is None:
+        return LSM.snapshot, None
+    try:
+        when = history.parse_time(at)
+    except ValueError:
+        return None, make_response(
+            jsonify({"error": "at must be epoch seconds or an ISO 8601 date and time"}), 400
+        )
+    if LSM.history is None:
+        return None, make_response(jsonify({"error": "History is not kept, see history_dir"}), 404)
+    snapshot = LSM.snapshot_at(when)
+    if snapshot is None:
+        return None, make_response(jsonify({"error": f"No history as far back as {at}"}), 404)
+    return snapshot, None
 
 
 @app.route("/")
 def home():
     """Flask root endpoint"""
+    snapshot = LSM.snapshot
     return make_response(
         render_template(
             "home.html",
             title="LSDB Report",
-            hosts_list=str(LSM.get_hosts()),
-            lsdb=yaml.dump(LSM.get_lsdb()),
+            hosts_list=str(LSM.get_hosts(snapshot)),
+            lsdb=yaml.dump(LSM.get_lsdb(snapshot)),
         ),
         200,
     )
@@ -37,20 +167,193 @@ def home():
 
 @app.route("/hosts")
 def rest_get_hosts():
-    """Flask endpoint to return all nodes in the LSDB graph"""
-    return make_response(jsonify(LSM.get_hosts()), 200)
+    """Flask endpoint to return all nodes in the LSDB graph, as of ?at=<time> if given"""
+    snapshot, error = requested_snapshot()
+    if error:
+        return error
+    return cached_response(
+        "/hosts",
+        lambda snapshot: CachedBody.json(LSM.get_hosts(snapshot), snapshot.generation),
+        snapshot,
+    )
 
 
 @app.route("/lsdb")
 def rest_get_lsdb():
-    """Flask endpoint to return the LSDB as gleaned from GoBGP's BGP-LS table"""
-    return make_response(jsonify(LSM.get_lsdb()), 200)
+    """Flask endpoint to return the LSDB as gleaned from GoBGP's BGP-LS table, as JSON,
+    MessagePack or CBOR depending on Accept"""
+    return negotiated_response("/lsdb", LSM.get_lsdb)
+
+
+@app.route("/debug/lsdb")
+def rest_debug_lsdb():
+    """Flask endpoint to return the LSDB as YAML, for debugging"""
+    return cached_response(
+        "/debug/lsdb",
+        lambda snapshot: CachedBody(
+            diagnostics.lsdb_yaml(snapshot.lsdb).encode(), "text/yaml", snapshot.generation
+        ),
+    )
+
+
+@app.route("/metrics")
+def rest_get_metrics():
+    """Flask endpoint to return refresh, LSDB and API metrics in Prometheus text format"""
+    body, content_type = metrics.exposition()
+    return Response(body, 200, content_type=content_type)
+
+
+@app.route("/sources")
+def rest_get_sources():
+    """Flask endpoint to return the freshness of every GoBGP instance collected from"""
+    return make_response(jsonify(LSM.get_sources()), 200)
 
 
 @app.route("/nx")
 def rest_get_networkx_graph():
-    """Flask endpoint to return the LSDB as a NetworkX BiDirGraph object in JSON format"""
-    return make_response(jsonify(LSM.get_graph()), 200)
+    """Flask endpoint to return the LSDB as a NetworkX BiDirGraph object in JSON format, or
+    MessagePack or CBOR, or its node or link table as an Arrow IPC stream, depending on Accept
+
+    Examples:
+        $ curl http://127.0.0.1/nx?at=2021-01-11T13:21:42Z
+        $ curl -H "Accept: application/vnd.apache.arrow.stream" http://127.0.0.1/nx?table=nodes
+        $ curl "http://127.0.0.1/nx?format=columnar&columns=name,igpMetric"
+        {"directed":true,"links":{"dst":[3,0, ...],"igpMetric":[10,10, ...],"src":[0,1, ...]}, ...
+
+    Query Args:
+        at: Epoch seconds or ISO 8601 date and time to return the graph as of, now by default
+        table: nodes or links (default), when responding with an Arrow IPC stream
+        format: node-link (default), or columnar for node and link tables, see
+            LinkStateManager.get_columnar_graph()
+        columns: Comma-separated attribute columns to include with format=columnar, all of them
+            by default
+    """
+    snapshot, error = requested_snapshot()
+    if error:
+        return error
+    graph_format = request.args.get("format", "node-link")
+    if graph_format == "node-link":
+        return negotiated_response("/nx", LSM.get_graph, snapshot, tables=True)
+    if graph_format != "columnar":
+        return make_response(jsonify({"error": "format must be node-link or columnar"}), 400)
+
+    columns = request.args.get("columns")
+    if columns is not None:
+        columns = sorted({column for column in columns.split(",") if column})
+        unknown = [column for column in columns if column not in NODE_COLUMNS + LINK_COLUMNS]
+        if unknown:
+            return make_response(
+                jsonify(
+                    {
+                        "error": f"Unknown columns {unknown}, expected some of "
+                        f"{list(NODE_COLUMNS + LINK_COLUMNS)}"
+                    }
+                ),
+                400,
+            )
+    # Named after the columns in a canonical order, so that any order shares one cached body
+    return negotiated_response(
+        f"/nx?format=columnar&columns={','.join(columns) if columns is not None else '*'}",
+        lambda snapshot: LSM.get_columnar_graph(snapshot, columns),
+        snapshot,
+    )
+
+
+@app.route("/nx/diff")
+def rest_get_networkx_graph_diff():
+    """Flask endpoint to return what moved in the NetworkX graph since a generation
+
+    Examples:
+        $ curl http://127.0.0.1/nx/diff?since=42
+        {"generation":43,"links":{"added":[],"changed":[{"bandwidthCost":10, ...
+
+    Query Args:
+        since: Generation the client last saw, i.e. the "generation" of its previous response
+
+    Returns:
+        See LinkStateManager.get_diff(), "resync" is true when the full graph is returned
+    """
+    since = request.args.get("since", type=int)
+    if since is None:
+        return make_response(jsonify({"error": "since must be a generation number"}), 400)
+    snapshot = LSM.snapshot
+    # Every generation out of the journal gets the same resync, serialized once
+    name = f"/nx/diff?since={since}" if LSM.journal.covers(since, snapshot) else "/nx/diff"
+    return cached_response(
+        name,
+        lambda snapshot: CachedBody.json(LSM.get_diff(since, snapshot), snapshot.generation),
+        snapshot,
+    )
+
+
+@app.route("/nx/stream")
+def rest_stream_networkx_graph():
+    """Flask endpoint streaming changes to the NetworkX graph as Server-Sent Events
+
+    The first event is a `resync` carrying the full graph as served by /nx, unless the client
+    resumes from a generation still in the journal. Every event after that is a `delta`, see
+    ChangeJournal.delta() for its format. Each event's id is the generation it brings the client
+    up to, qualified with the instance ID like ETags are.
+
+    Examples:
+        $ curl -N http://127.0.0.1/nx/stream?since=42
+
+    Query Args:
+        since: Generation to resume from, also taken from the Last-Event-ID header on reconnect
+    """
+    since = request.args.get("since", type=int)
+    instance, _, generation = request.headers.get("Last-Event-ID", "").partition("-")
+    if instance == INSTANCE_ID and generation.isdigit():
+        since = int(generation)
+
+    # Events are serialized once per generation, and deltas once per generation they start from,
+    # however many clients are following. A resync is the body /nx serves as JSON
+    def events():
+        for snapshot, delta in LSM.follow(since):
+            if snapshot is None:
+                yield b": keepalive\n\n"
+            elif delta is None:
+                yield snapshot.cached(
+                    "/nx/stream;resync",
+                    lambda snapshot: sse_event(
+                        "resync", snapshot.generation, graph_body(snapshot).body.rstrip()
+                    ),
+                )
+            else:
+                yield snapshot.cached(
+                    f"/nx/stream;since={delta['since']}",
+                    lambda snapshot, delta=delta: sse_event(
+                        "delta", snapshot.generation, json_line(delta)
+                    ),
+                )
+
+    return Response(
+        events(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def graph_body(snapshot: Snapshot) -> CachedBody:
+    """The JSON body /nx serves for a snapshot, serialized at most once per generation"""
+    return snapshot.cached(
+        "/nx", lambda snapshot: CachedBody.json(LSM.get_graph(snapshot), snapshot.generation)
+    )
+
+
+def json_line(data) -> bytes:
+    """Serializes data as single-line JSON, like CachedBody.json() does"""
+    return json.dumps(data, sort_keys=True, separators=(",", ":")).encode()
+
+
+def sse_event(event: str, generation: int, data: bytes) -> bytes:
+    """Formats one Server-Sent Event, data being single-line JSON"""
+    return b"event: %s\nid: %s-%d\ndata: %s\n\n" % (
+        event.encode(),
+        INSTANCE_ID.encode(),
+        generation,
+        data,
+    )
 
 
 @app.route("/shortest_path/<source_node>/<target_node>/hosts", methods=["POST"])
@@ -60,19 +363,32 @@ def rest_shortest_path_hosts(source_node: str, target_node: str):
     Examples:
         $ curl -X POST http://127.0.0.1/shortest_path/0000.0000.0001/0000.0000.0009
         ["0000.0000.0001","0000.0000.0005","0000.0000.0009"]
+        $ curl -X POST http://127.0.0.1/shortest_path/0000.0000.0001/0000.0000.0009?weight=teMetric
 
     Args:
         source_node:
         target_node:
 
+    Query Args:
+        weight: Link cost to minimise, igpMetric (default), teMetric or bandwidthCost
+        at: Epoch seconds or ISO 8601 date and time to compute the path as of, now by default
+
     Returns:
 
     """
+    weight = request.args.get("weight", "igpMetric")
+    if weight not in LINK_WEIGHTS:
+        return unknown_weight_response(weight)
+    snapshot, error = requested_snapshot()
+    if error:
+        return error
     return make_response(
         jsonify(
             LSM.get_shortest_path(
                 source_node=source_node,
                 target_node=target_node,
+                snapshot=snapshot,
+                weight=weight,
             )
         ),
         200,
@@ -93,22 +409,108 @@ def rest_shortest_path(source_node: str, target_node: str):
         source_node:
         target_node:
 
+    Query Args:
+        weight: Link cost to minimise, igpMetric (default), teMetric or bandwidthCost
+        at: Epoch seconds or ISO 8601 date and time to compute the path as of, now by default
+
     Returns:
 
     """
+    weight = request.args.get("weight", "igpMetric")
+    if weight not in LINK_WEIGHTS:
+        return unknown_weight_response(weight)
+    snapshot, error = requested_snapshot()
+    if error:
+        return error
     return make_response(
         jsonify(
             LSM.get_shortest_path_subgraph(
                 source_node=source_node,
                 target_node=target_node,
+                snapshot=snapshot,
+                weight=weight,
             )
         ),
         200,
     )
 
 
+@app.route("/k_shortest_paths/<source_node>/<target_node>", methods=["POST"])
+def rest_k_shortest_paths(source_node: str, target_node: str):
+    """Calculates up to k loop-free paths, cheapest first, each as its cost and an ordered list
+    of node names
+
+    Examples:
+        $ curl -X POST http://127.0.0.1/k_shortest_paths/0000.0000.0001/0000.0000.0009?k=2
+        [{"cost":20,"path":["0000.0000.0001","0000.0000.0005","0000.0000.0009"]},{"cost":30, ...
+
+    Args:
+        source_node:
+        target_node:
+
+    Query Args:
+        k: Most paths to return, 3 by default, at most max_k_paths
+        weight: Link cost to minimise, igpMetric (default), teMetric or bandwidthCost
+        at: Epoch seconds or ISO 8601 date and time to compute the paths as of, now by default
+
+    Returns:
+
+    """
+    weight = request.args.get("weight", "igpMetric")
+    if weight not in LINK_WEIGHTS:
+        return unknown_weight_response(weight)
+    k = request.args.get("k", 3, type=int)
+    if not 1 <= k <= MAX_K_PATHS:
+        return make_response(
+            jsonify({"error": f"k must be an integer from 1 to {MAX_K_PATHS}"}), 400
+        )
+    snapshot, error = requested_snapshot()
+    if error:
+        return error
+    return make_response(
+        jsonify(
+            LSM.get_k_shortest_paths(
+                source_node=source_node,
+                target_node=target_node,
+                k=k,
+                snapshot=snapshot,
+                weight=weight,
+            )
+        ),
+        200,
+    )
+
+
+@app.route("/reachable/<source_node>")
+def rest_reachable(source_node: str):
+    """Flask endpoint to return every node reachable from source_node, source_node included
+
+    Query Args:
+        at: Epoch seconds or ISO 8601 date and time to answer as of, now by default
+    """
+    snapshot, error = requested_snapshot()
+    if error:
+        return error
+    return make_response(jsonify(LSM.get_reachable(source_node, snapshot)), 200)
+
+
+@app.errorhandler(networkx.NodeNotFound)
+@app.errorhandler(networkx.NetworkXNoPath)
+def path_not_found_response(err: networkx.NetworkXException):
+    """404 response for a path request between nodes that aren't in the graph or connected"""
+    return make_response(jsonify({"error": str(err)}), 404)
+
+
+def unknown_weight_response(weight: str):
+    """400 response for a shortest path request with a weight not in LINK_WEIGHTS"""
+    return make_response(
+        jsonify({"error": f"Unknown weight {weight}, expected one of {list(LINK_WEIGHTS)}"}), 400
+    )
+
+
 def main():
-    """Entrypoint when ran as a script"""
+    """Entrypoint when ran as a script, Flask's development server. See gunicorn.conf.py to serve
+    in production"""
     app.run(debug=False, host=CONF["flask_bind_ip"], port=CONF["flask_bind_port"])
 
 
@@ -0,0 +1,245 @@
+"""Array-backed topology engine for path computations, derived from a snapshot's NetworkX graph
+
+NetworkX's dict-of-dicts is kept for /nx, path computations run on compressed sparse row (CSR)
+arrays instead: nodes are numbered 0..n-1, the links leaving node i are entries
+indptr[i]..indptr[i+1]-1 of indices (remote node) and of each weight vector.
+"""
+import heapq
+import math
+from typing import Iterable, List, Tuple
+import networkx as nx
+import numpy as np
+from .graphing import LINK_WEIGHTS
+
+
+class CSRGraph:
+    """Compact, read-only copy of a graph's topology and link weights
+
+    Attributes:
+        nodes: List of node names, a node's position is its integer ID
+        index: Dict of node name to integer ID
+        indptr: int32 array of n+1 offsets into indices, per node
+        indices: int32 array of remote node IDs, one entry per link
+        weights: Dict of weight name to float64 array, one entry per link
+    """
+
+    def __init__(self, graph: nx.MultiDiGraph, weights: Iterable[str]):
+        """Constructor
+
+        Args:
+            graph: Graph to copy, parallel links are kept as separate entries
+            weights: Names of numeric edge attributes to copy, missing attributes count as 1
+        """
+        self.nodes = list(graph.nodes)
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        weights = list(weights)
+
+        sources, targets, costs = [], [], {name: [] for name in weights}
+        for local, remote, attributes in graph.edges(data=True):
+            sources.append(self.index[local])
+            targets.append(self.index[remote])
+            for name in weights:
+                costs[name].append(attributes.get(name, 1))
+
+        order = np.argsort(np.asarray(sources, dtype=np.int32), kind="stable")
+        self.indptr = np.zeros(len(self.nodes) + 1, dtype=np.int32)
+        np.cumsum(np.bincount(sources, minlength=len(self.nodes)), out=self.indptr[1:])
+        self.indices = np.asarray(targets, dtype=np.int32)[order]
+        self.weights = {name: np.asarray(costs[name], dtype=np.float64)[order] for name in weights}
+
+        # Zero-copy views, indexing these yields plain Python numbers which keeps the loops in
+        # dijkstra() fast
+        self.__indptr = memoryview(self.indptr)
+        self.__indices = memoryview(self.indices)
+        self.__weights = {name: memoryview(array) for name, array in self.weights.items()}
+
+    def __id(self, node: str) -> int:
+        """Integer ID of a node name
+
+        Raises:
+            networkx.NodeNotFound: When node is not in the graph
+        """
+        try:
+            return self.index[node]
+        except KeyError:
+            raise nx.NodeNotFound(f"Node {node} is not in G") from None
+
+    def dijkstra(
+        self,
+        source: str,
+        weight: str,
+        target: str = None,
+        banned_nodes: frozenset = frozenset(),
+        banned_links: frozenset = frozenset(),
+    ) -> Tuple[List[float], List[List[int]]]:
+        """Heap-based Dijkstra from source
+
+        Args:
+            source: Node name to start from
+            weight: Name of the weight vector to use as link costs
+            target: When given, stops as soon as the cheapest path to it is known
+            banned_nodes: Node IDs to treat as absent
+            banned_links: (local ID, remote ID) pairs to treat as absent, parallel links included
+
+        Returns:
+            Tuple of (distances, predecessors), both indexed by node ID. Unreachable nodes have
+            a distance of math.inf. Predecessors lists every node preceding a node on an equal
+            cost shortest path
+
+        Raises:
+            networkx.NodeNotFound: When source is not in the graph
+        """
+        indptr, indices, costs = self.__indptr, self.__indices, self.__weights[weight]
+        source_id = self.__id(source)
+        target_id = self.index.get(target, -1)
+        distances = [math.inf] * len(self.nodes)
+        predecessors = [[] for _ in self.nodes]
+        settled = [False] * len(self.nodes)
+        distances[source_id] = 0
+        heap = [(0, source_id)]
+        while heap:
+            cost, node = heapq.heappop(heap)
+            if settled[node]:
+                continue
+            settled[node] = True
+            if node == target_id:
+                break
+            for link in range(indptr[node], indptr[node + 1]):
+                remote = indices[link]
+                if remote in banned_nodes or (node, remote) in banned_links:
+                    continue
+                next_cost = cost + costs[link]
+                if next_cost < distances[remote]:
+                    distances[remote] = next_cost
+                    predecessors[remote] = [node]
+                    heapq.heappush(heap, (next_cost, remote))
+                elif next_cost == distances[remote] and node not in predecessors[remote]:
+                    predecessors[remote].append(node)
+        return distances, predecessors
+
+    def shortest_path_tree(self, source: str, weight: str) -> Tuple[dict, dict]:
+        """Single-source shortest paths, in the same shape as
+        networkx.dijkstra_predecessor_and_distance()
+
+        Returns:
+            Tuple of (predecessors, distances), dicts keyed by node name, reachable nodes only
+        """
+        distances, predecessors = self.dijkstra(source, weight)
+        nodes = self.nodes
+        reachable = [i for i, cost in enumerate(distances) if cost != math.inf]
+        return (
+            {nodes[i]: [nodes[pred] for pred in predecessors[i]] for i in reachable},
+            {nodes[i]: _as_int(distances[i]) for i in reachable},
+        )
+
+    def shortest_path(self, source: str, target: str, weight: str) -> List[str]:
+        """Returns a shortest path from source to target, as a list of node names
+
+        Raises:
+            networkx.NodeNotFound: When source or target is not in the graph
+            networkx.NetworkXNoPath: When target is not reachable from source
+        """
+        _, path = self.__path(source, target, weight)
+        if path is None:
+            raise nx.NetworkXNoPath(f"Node {target} not reachable from {source}")
+        return [self.nodes[node] for node in path]
+
+    def __path(self, source, target, weight, banned_nodes=frozenset(), banned_links=frozenset()):
+        """Cost and node IDs of a shortest path, or (math.inf, None) if there is none"""
+        source_id, target_id = self.__id(source), self.__id(target)
+        distances, predecessors = self.dijkstra(
+            source, weight, target, banned_nodes=banned_nodes, banned_links=banned_links
+        )
+        if distances[target_id] == math.inf:
+            return math.inf, None
+        # The first predecessor of a node is always settled before it, so this reaches the
+        # source, which only has predecessors itself when a zero cost cycle leads back to it
+        path = [target_id]
+        while path[-1] != source_id:
+            path.append(predecessors[path[-1]][0])
+        path.reverse()
+        return distances[target_id], path
+
+    def k_shortest_paths(self, source: str, target: str, k: int, weight: str) -> List[dict]:
+        """Up to k loop-free paths from source to target, cheapest first (Yen's algorithm)
+
+        Returns:
+            List of {"cost": cost, "path": [node names]}
+
+        Raises:
+            networkx.NodeNotFound: When source or target is not in the graph
+        """
+        cost, path = self.__path(source, target, weight)
+        if path is None:
+            return []
+        costs = self.__weights[weight]
+        found = [(cost, path)]
+        candidates = []
+        seen = {tuple(path)}
+        while len(found) < k:
+            previous = found[-1][1]
+            for spur_index in range(len(previous) - 1):
+                root = previous[: spur_index + 1]
+                banned_links = frozenset(
+                    (path[spur_index], path[spur_index + 1])
+                    for _, path in found
+                    if path[: spur_index + 1] == root
+                )
+                banned_nodes = frozenset(root[:-1])
+                spur_cost, spur = self.__path(
+                    self.nodes[root[-1]], target, weight, banned_nodes, banned_links
+                )
+                if spur is None:
+                    continue
+                candidate = root[:-1] + spur
+                if tuple(candidate) in seen:
+                    continue
+                seen.add(tuple(candidate))
+                root_cost = sum(
+                    self.__link_cost(costs, local, remote) for local, remote in zip(root, root[1:])
+                )
+                heapq.heappush(candidates, (root_cost + spur_cost, candidate))
+            if not candidates:
+                break
+            found.append(heapq.heappop(candidates))
+        return [
+            {"cost": _as_int(cost), "path": [self.nodes[node] for node in path]}
+            for cost, path in found
+        ]
+
+    def __link_cost(self, costs, local: int, remote: int) -> float:
+        """Cost of the cheapest link from local to remote"""
+        return min(
+            costs[link]
+            for link in range(self.__indptr[local], self.__indptr[local + 1])
+            if self.__indices[link] == remote
+        )
+
+    def reachable(self, source: str) -> List[str]:
+        """Returns the names of every node reachable from source, source included
+
+        Raises:
+            networkx.NodeNotFound: When source is not in the graph
+        """
+        indptr, indices = self.__indptr, self.__indices
+        seen = [False] * len(self.nodes)
+        stack = [self.__id(source)]
+        seen[stack[0]] = True
+        while stack:
+            node = stack.pop()
+            for link in range(indptr[node], indptr[node + 1]):
+                if not seen[indices[link]]:
+                    seen[indices[link]] = True
+                    stack.append(indices[link])
+        return [self.nodes[i] for i, found in enumerate(seen) if found]
+
+
+def for_snapshot(snapshot) -> CSRGraph:
+    """Returns the CSRGraph of a snapshot's graph with every weight in LINK_WEIGHTS, built once
+    per snapshot"""
+    return snapshot.cached("csr", lambda snapshot: CSRGraph(snapshot.graph, LINK_WEIGHTS))
+
+
+def _as_int(cost: float):
+    """Costs are summed as floats, hand whole numbers back as int like NetworkX would"""
+    return int(cost) if float(cost).is_integer() else cost
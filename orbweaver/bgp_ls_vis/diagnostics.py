@@ -0,0 +1,56 @@
+"""Logging setup and LSDB debug dumps for bgp_ls_vis
+
+Everything logs under the `bgp_ls_vis` logger. Full LSDB dumps go to their own logger,
+`bgp_ls_vis.lsdb_dump`, which is silent unless a dump file is configured. The YAML for a dump is
+only ever built when that logger would actually emit it.
+"""
+import logging
+from logging.handlers import RotatingFileHandler
+import yaml
+
+LOGGER = logging.getLogger("bgp_ls_vis")
+DUMP_LOGGER = logging.getLogger("bgp_ls_vis.lsdb_dump")
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+def configure(
+    level: str = "INFO",
+    lsdb_dump_file: str = None,
+    lsdb_dump_max_bytes: int = 10 * 1024 * 1024,
+    lsdb_dump_backups: int = 3,
+):
+    """Sets up logging for bgp_ls_vis
+
+    Args:
+        level: Log level name for bgp_ls_vis, e.g. DEBUG, INFO, WARNING
+        lsdb_dump_file: When set, the full LSDB is dumped as YAML to this file on every refresh
+        lsdb_dump_max_bytes: Size at which the dump file is rotated
+        lsdb_dump_backups: Rotated dump files to keep
+    """
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    LOGGER.handlers = [handler]
+    LOGGER.setLevel(level.upper())
+
+    DUMP_LOGGER.propagate = False
+    DUMP_LOGGER.handlers = []
+    if lsdb_dump_file:
+        handler = RotatingFileHandler(
+            lsdb_dump_file, maxBytes=lsdb_dump_max_bytes, backupCount=lsdb_dump_backups
+        )
+        handler.setFormatter(logging.Formatter("--- # %(asctime)s\n%(message)s"))
+        DUMP_LOGGER.addHandler(handler)
+        DUMP_LOGGER.setLevel(logging.DEBUG)
+    else:
+        DUMP_LOGGER.setLevel(logging.CRITICAL + 1)
+
+
+def lsdb_yaml(lsdb: list) -> str:
+    """Returns an LSDB of records as YAML, in the format served over REST"""
+    return yaml.dump([lsa.to_dict() for lsa in lsdb])
+
+
+def dump_lsdb(lsdb: list):
+    """Dumps an LSDB of records to the LSDB dump file, if one is configured"""
+    if DUMP_LOGGER.isEnabledFor(logging.DEBUG) and DUMP_LOGGER.handlers:
+        DUMP_LOGGER.debug(lsdb_yaml(lsdb))
@@ -1,30 +1,289 @@
 """Discrete graphing tools for bgp_ls_vis"""
+from itertools import chain
+from typing import Iterable
 import networkx as nx
+from networkx.readwrite.json_graph import node_link_data
+from .records import LSA
+
+
+# Bandwidth-derived cost is REFERENCE_BANDWIDTH / bandwidth, as OSPF auto-cost does it. Links
+# that don't advertise a bandwidth cost MAX_BANDWIDTH_COST
+REFERENCE_BANDWIDTH = 100e9 / 8  # 100 Gbps, in bytes per second like LsAttributeLink.bandwidth
+MAX_BANDWIDTH_COST = 65535
+
+# Numeric edge attributes set on every link, usable as the weight for shortest path calculations
+LINK_WEIGHTS = {
+    "igpMetric": lambda lsa: lsa.igp_metric,
+    # Links without a TE metric fall back to their IGP metric
+    "teMetric": lambda lsa: lsa.te_metric or lsa.igp_metric,
+    "bandwidthCost": lambda lsa: (
+        max(1, round(REFERENCE_BANDWIDTH / lsa.bandwidth)) if lsa.bandwidth else MAX_BANDWIDTH_COST
+    ),
+}
+
+
+# Attribute columns of node_table() and link_table(), besides the identity of nodes and links
+NODE_COLUMNS = ("name", "asn", "protocol", "prefixes")
+LINK_COLUMNS = ("key", "localAddress", "remoteAddress", "bandwidth", *LINK_WEIGHTS)
 
 
 def build_nx_from_lsdb(lsdb: list) -> nx.MultiDiGraph:
     """Given an LSDB gleaned from BGP-LS table in GoBGP, constructs a NetworkX graph object
     and returns it"""
-    graph = nx.MultiDiGraph()
-
-    # init Node LSAs to NetworkX Graph object
-    for lsa in lsdb:
-        if lsa["nlri"]["nlri"]["type"] == "LsNodeNLRI":
-            graph.add_node(
-                lsa["nlri"]["nlri"]["localNode"]["igpRouterId"],
-                data=lsa,
-            )
+    updater = GraphUpdater()
+    updater.update(lsdb)
+    return updater.graph
+
+
+def graph_to_dict(graph: nx.MultiDiGraph) -> dict:
+    """Returns a graph built from an LSDB in node-link format, with LSA records as dicts"""
+    data = node_link_data(graph)
+    # Newer NetworkX releases name the list of links "edges"
+    for item in chain(data["nodes"], data.get("links", data.get("edges", []))):
+        if "data" in item:
+            item["data"] = item["data"].to_dict()
+        if "prefixes" in item:
+            item["prefixes"] = [lsa.to_dict() for lsa in item["prefixes"]]
+    return data
+
+
+def node_table(graph: nx.MultiDiGraph) -> dict:
+    """Returns the nodes of a graph built from an LSDB as columns, one row per node
+
+    Columns are id (igpRouterId), name, asn and protocol, taken from the node's LSA (null for
+    nodes only known from links or prefixes, name falling back to the id), and prefixes, the
+    list of CIDRs the node advertises.
+    """
+    columns = {"id": [], **{name: [] for name in NODE_COLUMNS}}
+    for node, attributes in graph.nodes(data=True):
+        lsa = attributes.get("data")
+        columns["id"].append(node)
+        columns["name"].append(lsa.name if lsa else node)
+        columns["asn"].append(lsa.asn if lsa else None)
+        columns["protocol"].append(lsa.protocol if lsa else None)
+        columns["prefixes"].append(
+            [cidr for prefix in attributes.get("prefixes", ()) for cidr in prefix.prefixes]
+        )
+    return columns
+
+
+def link_table(graph: nx.MultiDiGraph) -> dict:
+    """Returns the links of a graph built from an LSDB as columns, one row per link
+
+    Columns are source, target and key as in graph_to_dict(), localAddress, remoteAddress and
+    bandwidth from the link's LSA, and every one of LINK_WEIGHTS.
+    """
+    columns = {"source": [], "target": [], **{name: [] for name in LINK_COLUMNS}}
+    for source, target, key, attributes in graph.edges(keys=True, data=True):
+        lsa = attributes["data"]
+        columns["source"].append(source)
+        columns["target"].append(target)
+        columns["key"].append(key)
+        columns["localAddress"].append(lsa.local_address)
+        columns["remoteAddress"].append(lsa.remote_address)
+        columns["bandwidth"].append(lsa.bandwidth)
+        for name in LINK_WEIGHTS:
+            columns[name].append(attributes[name])
+    return columns
+
+
+def columnar_graph(graph: nx.MultiDiGraph, columns: Iterable[str] = None) -> dict:
+    """Returns a graph built from an LSDB as a node table and a link table, column by column
+
+    A compact alternative to graph_to_dict(): links refer to nodes by their position in the node
+    table (src and dst) rather than by name, and only flat attributes are included rather than
+    whole LSA records.
+
+    Args:
+        graph: Graph to convert
+        columns: Names from NODE_COLUMNS and LINK_COLUMNS to include, all of them if not given.
+            Node ids, src and dst are always included
+
+    Returns:
+        {"directed": true, "multigraph": true, "nodes": {"id": [...], ...},
+        "links": {"src": [...], "dst": [...], ...}}, each column a list with one value per
+        node or link
+    """
+    nodes = node_table(graph)
+    links = link_table(graph)
+    index = {node: i for i, node in enumerate(nodes["id"])}
+    src = [index[node] for node in links.pop("source")]
+    dst = [index[node] for node in links.pop("target")]
+    if columns is not None:
+        columns = set(columns)
+        nodes = {name: values for name, values in nodes.items() if name == "id" or name in columns}
+        links = {name: values for name, values in links.items() if name in columns}
+    return {
+        "directed": True,
+        "multigraph": True,
+        "nodes": nodes,
+        "links": {"src": src, "dst": dst, **links},
+    }
+
+
+class ChangeSet:
+    """What moved in the graph during one GraphUpdater.update() or GraphUpdater.apply() call
+
+    Nodes are identified by igpRouterId. Links by (local igpRouterId, remote igpRouterId, key)
+    and prefixes by (igpRouterId, key), where key is the NLRI identity of the LSA record.
+    """
+
+    def __init__(self):
+        """Constructor"""
+        self.nodes_added = set()
+        self.nodes_changed = set()
+        self.nodes_removed = set()
+        self.links_added = set()
+        self.links_changed = set()
+        self.links_removed = set()
+        self.prefixes_added = set()
+        self.prefixes_changed = set()
+        self.prefixes_removed = set()
 
-    # init Link and Prefix LSAs to NetworkX Graph object
-    for lsa in lsdb:
-        if lsa["nlri"]["nlri"]["type"] == "LsLinkNLRI":
-            graph.add_edge(
-                lsa["nlri"]["nlri"]["localNode"]["igpRouterId"],
-                lsa["nlri"]["nlri"]["remoteNode"]["igpRouterId"],
-                data=lsa,
+    def __bool__(self) -> bool:
+        """True if anything at all moved"""
+        return any(vars(self).values())
+
+    def as_dict(self) -> dict:
+        """Returns the change set as a JSON serialisable dict of lists"""
+        return {name: sorted(items) for name, items in vars(self).items()}
+
+
+class GraphUpdater:
+    """Maintains a NetworkX graph from an LSDB, touching only what changed between updates
+
+    Node LSAs become nodes named by igpRouterId with the LSA record under `data`. Link LSAs
+    become edges keyed by NLRI identity with the LSA record under `data`, and each of
+    LINK_WEIGHTS as a plain number so Dijkstra doesn't have to dig through the record. Prefix
+    LSAs are listed under the `prefixes` attribute of the node that advertises them.
+
+    A node referenced by a link or prefix but with no node LSA of its own is still added to the
+    graph, without `data`, and is removed again once nothing references it.
+    """
+
+    def __init__(self):
+        """Constructor"""
+        self.graph = nx.MultiDiGraph()
+        self.__lsas = {}  # NLRI key -> LSA
+        self.__prefixes = {}  # igpRouterId -> {NLRI key -> LSA}
+
+    @property
+    def lsdb(self) -> list:
+        """The LSDB the graph currently reflects"""
+        return list(self.__lsas.values())
+
+    def update(self, lsdb: list) -> ChangeSet:
+        """Brings the graph in line with a full LSDB, anything not in lsdb is withdrawn
+
+        Args:
+            lsdb: Full LSDB, as returned by GoBGPQueryWrapper.get_lsdb()
+
+        Returns:
+            What moved in the graph
+        """
+        table = {lsa.key: lsa for lsa in lsdb}
+        withdrawn = [key for key in self.__lsas if key not in table]
+        return self.__apply(table, withdrawn)
+
+    def apply(self, upserts: Iterable[LSA] = (), withdrawn: Iterable[LSA] = ()) -> ChangeSet:
+        """Applies individual LSA adds/changes and withdraws to the graph
+
+        Args:
+            upserts: LSAs that are new or may have changed
+            withdrawn: LSAs that are gone, only their NLRI is looked at
+
+        Returns:
+            What moved in the graph
+        """
+        table = {lsa.key: lsa for lsa in upserts}
+        return self.__apply(table, [lsa.key for lsa in withdrawn])
+
+    def __apply(self, table: dict, withdrawn: list) -> ChangeSet:
+        """Applies withdraws first, then node LSAs, then link and prefix LSAs that depend on them"""
+        changes = ChangeSet()
+        for key in withdrawn:
+            if key in self.__lsas:
+                self.__remove(key, self.__lsas.pop(key), changes)
+
+        upserts = [(key, lsa) for key, lsa in table.items() if self.__lsas.get(key) != lsa]
+        upserts.sort(key=lambda item: item[1].type != "LsNodeNLRI")
+        for key, lsa in upserts:
+            old_lsa = self.__lsas.get(key)
+            self.__lsas[key] = lsa
+            self.__add(key, lsa, old_lsa is not None, changes)
+
+        # Nodes pruned by a withdraw and added back by an upsert (e.g. their only link replaced
+        # by another one) were there all along, and changed if their node LSA went meanwhile
+        readded = changes.nodes_added & changes.nodes_removed
+        changes.nodes_added -= readded
+        changes.nodes_removed -= readded
+        # Nodes both added and changed in one pass (e.g. implicitly by a link, then by their own
+        # node LSA) are reported as added only, and removed ones as removed only
+        changes.nodes_changed -= changes.nodes_added | changes.nodes_removed
+        return changes
+
+    def __add(self, key: str, lsa: LSA, existed: bool, changes: ChangeSet):
+        """Adds or replaces a single LSA in the graph"""
+        local_node = lsa.router_id
+        if lsa.type == "LsNodeNLRI":
+            self.__ensure_node(local_node, changes)
+            self.graph.nodes[local_node]["data"] = lsa
+            changes.nodes_changed.add(local_node)
+
+        elif lsa.type == "LsLinkNLRI":
+            remote_node = lsa.remote_router_id
+            self.__ensure_node(local_node, changes)
+            self.__ensure_node(remote_node, changes)
+            weights = {name: weight(lsa) for name, weight in LINK_WEIGHTS.items()}
+            self.graph.add_edge(local_node, remote_node, key=key, data=lsa, **weights)
+            (changes.links_changed if existed else changes.links_added).add(
+                (local_node, remote_node, key)
             )
 
-        if lsa["nlri"]["nlri"]["type"] == "LsPrefixV4NLRI":
-            graph.nodes[lsa["nlri"]["nlri"]["localNode"]["igpRouterId"]]["data"] = lsa
+        elif lsa.type == "LsPrefixV4NLRI":
+            self.__ensure_node(local_node, changes)
+            self.__prefixes.setdefault(local_node, {})[key] = lsa
+            self.graph.nodes[local_node]["prefixes"] = list(self.__prefixes[local_node].values())
+            (changes.prefixes_changed if existed else changes.prefixes_added).add((local_node, key))
+
+    def __remove(self, key: str, lsa: LSA, changes: ChangeSet):
+        """Removes a single LSA from the graph"""
+        local_node = lsa.router_id
+        if lsa.type == "LsNodeNLRI":
+            self.graph.nodes[local_node].pop("data", None)
+            changes.nodes_changed.add(local_node)
+
+        elif lsa.type == "LsLinkNLRI":
+            remote_node = lsa.remote_router_id
+            self.graph.remove_edge(local_node, remote_node, key=key)
+            changes.links_removed.add((local_node, remote_node, key))
+            self.__prune_node(remote_node, changes)
+
+        elif lsa.type == "LsPrefixV4NLRI":
+            del self.__prefixes[local_node][key]
+            if self.__prefixes[local_node]:
+                self.graph.nodes[local_node]["prefixes"] = list(
+                    self.__prefixes[local_node].values()
+                )
+            else:
+                del self.__prefixes[local_node]
+                del self.graph.nodes[local_node]["prefixes"]
+            changes.prefixes_removed.add((local_node, key))
+
+        self.__prune_node(local_node, changes)
+
+    def __ensure_node(self, node: str, changes: ChangeSet):
+        """Adds a node to the graph if it isn't already there"""
+        if node not in self.graph:
+            self.graph.add_node(node)
+            changes.nodes_added.add(node)
 
-    return graph
+    def __prune_node(self, node: str, changes: ChangeSet):
+        """Removes a node once it has no node LSA, links or prefixes left referencing it"""
+        if node not in self.graph:
+            return
+        attributes = self.graph.nodes[node]
+        if "data" in attributes or "prefixes" in attributes or self.graph.degree(node):
+            return
+        self.graph.remove_node(node)
+        changes.nodes_removed.add(node)
@@ -0,0 +1,252 @@
+"""Append-only history of the LSDB on disk, to look up what it was at any point in time
+
+History is kept as segments, each a keyframe of the full LSDB followed by up to
+keyframe_interval deltas, one per snapshot published. The LSDB as of any time is rebuilt by
+seeking to the keyframe of the segment covering it and replaying its deltas. Segments older
+than the retention period are deleted as a whole.
+
+Each segment is two files named after the generation of its keyframe, in which all integers
+are little endian:
+
+    <generation>.dat  Records back to back, each of:
+        kind        uint8, KEYFRAME or DELTA
+        timestamp   float64, epoch time the snapshot was published
+        generation  uint64
+        upserts     uint32, number of paths added or changed (all of them for a keyframe)
+        withdrawn   uint32, number of NLRIs withdrawn
+        lengths     uint32 * upserts, length of each path
+        paths       every serialized gobgp.Path, back to back
+        keys        8 bytes * withdrawn, records.LSA.key of each NLRI withdrawn
+    <generation>.idx  Timestamp index, an entry per record of:
+        timestamp   float64
+        generation  uint64
+        offset      uint64, of the record in the .dat file
+
+Only the collecting process writes. An index entry is appended once its record is complete, so
+any process can read history while it is being written.
+"""
+import bisect
+import logging
+import os
+import struct
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from . import records
+from .records import LSA
+
+LOGGER = logging.getLogger(__name__)
+
+KEYFRAME = 0
+DELTA = 1
+RECORD = struct.Struct("<BdQII")
+INDEX_ENTRY = struct.Struct("<dQQ")
+
+
+class TopologyHistory:
+    """Reads and writes the history kept in a directory, see the module docstring"""
+
+    def __init__(self, directory: str, keyframe_interval: int = 100, retention: float = None):
+        """Constructor
+
+        Args:
+            directory: Where segments are kept, created if missing
+            keyframe_interval: Deltas to record before starting a new segment with a keyframe.
+                Lookups replay at most this many deltas
+            retention: Seconds of history to keep, forever if not set
+        """
+        self.directory = directory
+        self.keyframe_interval = keyframe_interval
+        self.retention = retention
+        os.makedirs(directory, exist_ok=True)
+        self.__lock = threading.Lock()
+        # Per segment, by keyframe generation: index entries read so far, as parallel lists
+        self.__segments: Dict[int, Tuple[List[float], List[int], List[int]]] = {}
+        self.__recorded = None  # Dict of NLRI key to LSA, as of the last record written
+        self.__segment = None  # Generation of the segment being written
+        self.__deltas = 0  # Deltas written to it
+
+    def __path(self, segment: int, extension: str) -> str:
+        return os.path.join(self.directory, f"{segment:020d}.{extension}")
+
+    @property
+    def last_generation(self) -> int:
+        """Generation of the last snapshot recorded, 0 if none"""
+        with self.__lock:
+            self.__load_index()
+            if not self.__segments:
+                return 0
+            return self.__segments[max(self.__segments)][1][-1]
+
+    def record(self, snapshot):
+        """Appends a snapshot, as a delta from the one recorded before it or as a keyframe
+
+        Every process recording restarts with a keyframe, so a segment is only ever written by
+        a single process and the records of a process that stopped halfway are never replayed.
+        """
+        lsas = snapshot.lsas
+        with self.__lock:
+            if self.__recorded is None or self.__deltas >= self.keyframe_interval:
+                kind, upserts, withdrawn = KEYFRAME, list(lsas.values()), []
+                self.__segment = snapshot.generation
+                self.__deltas = 0
+                self.__expire(snapshot.created)
+            else:
+                kind = DELTA
+                # Records of LSAs that didn't change are carried over from one snapshot to the
+                # next, identity is enough to tell them apart
+                upserts = [lsa for key, lsa in lsas.items() if self.__recorded.get(key) is not lsa]
+                withdrawn = [key for key in self.__recorded if key not in lsas]
+                self.__deltas += 1
+            self.__recorded = lsas
+
+            paths = [lsa.path for lsa in upserts]
+            with open(self.__path(self.__segment, "dat"), "ab") as file:
+                offset = file.tell()
+                file.write(
+                    RECORD.pack(
+                        kind, snapshot.created, snapshot.generation, len(paths), len(withdrawn)
+                    )
+                )
+                file.write(struct.pack(f"<{len(paths)}I", *map(len, paths)))
+                file.write(b"".join(paths))
+                file.write(b"".join(bytes.fromhex(key) for key in withdrawn))
+            with open(self.__path(self.__segment, "idx"), "ab") as file:
+                file.write(INDEX_ENTRY.pack(snapshot.created, snapshot.generation, offset))
+
+    def __expire(self, now: float):
+        """Deletes segments that ended longer than retention ago, i.e. whose successor started
+        before then"""
+        if not self.retention:
+            return
+        self.__load_index()
+        segments = sorted(self.__segments)
+        for segment, successor in zip(segments, segments[1:]):
+            if self.__segments[successor][0][0] >= now - self.retention:
+                break
+            for extension in ("idx", "dat"):
+                try:
+                    os.unlink(self.__path(segment, extension))
+                except FileNotFoundError:
+                    pass
+            del self.__segments[segment]
+            LOGGER.info("Deleted history segment %d, older than the retention period", segment)
+
+    def __load_index(self):
+        """Reads index entries appended since the last call, and forgets deleted segments"""
+        present = set()
+        for name in os.listdir(self.directory):
+            if name.endswith(".idx") and name[:-4].isdigit():
+                present.add(int(name[:-4]))
+        for segment in list(self.__segments):
+            if segment not in present:
+                del self.__segments[segment]
+        for segment in present:
+            times, generations, offsets = self.__segments.setdefault(segment, ([], [], []))
+            try:
+                with open(self.__path(segment, "idx"), "rb") as file:
+                    file.seek(len(times) * INDEX_ENTRY.size)
+                    data = file.read()
+            except FileNotFoundError:
+                continue
+            # An entry being written may only be partly there yet
+            for entry in INDEX_ENTRY.iter_unpack(
+                data[: len(data) // INDEX_ENTRY.size * INDEX_ENTRY.size]
+            ):
+                times.append(entry[0])
+                generations.append(entry[1])
+                offsets.append(entry[2])
+        for segment in [segment for segment, entries in self.__segments.items() if not entries[0]]:
+            del self.__segments[segment]
+
+    def lookup(self, when: float) -> Optional[Tuple[float, int]]:
+        """Finds the last snapshot recorded at or before a point in time
+
+        Returns:
+            Tuple of (timestamp, generation) of the snapshot, None if history starts later
+        """
+        with self.__lock:
+            found = self.__find(when)
+            if found is None:
+                return None
+            segment, position = found
+            times, generations, _ = self.__segments[segment]
+            return times[position], generations[position]
+
+    def __find(self, when: float) -> Optional[Tuple[int, int]]:
+        """Segment and position within it of the last record at or before when"""
+        self.__load_index()
+        segments = sorted(self.__segments)
+        first_times = [self.__segments[segment][0][0] for segment in segments]
+        i = bisect.bisect_right(first_times, when) - 1
+        if i < 0:
+            return None
+        segment = segments[i]
+        return segment, bisect.bisect_right(self.__segments[segment][0], when) - 1
+
+    def lsdb_at(self, when: float, known: dict = None) -> Optional[Tuple[float, int, List[LSA]]]:
+        """Rebuilds the LSDB as it was at a point in time
+
+        Args:
+            when: Epoch time
+            known: Dict of serialized gobgp.Path to records.LSA already decoded from it, e.g. of
+                the current snapshot. Paths found in it aren't decoded again
+
+        Returns:
+            Tuple of (timestamp, generation, list of records.LSA) of the last snapshot recorded
+            at or before when, None if history starts later, including when the segment was
+            deleted for being older than retention while being looked up
+        """
+        with self.__lock:
+            found = self.__find(when)
+            if found is None:
+                return None
+            segment, position = found
+            times, generations, offsets = self.__segments[segment]
+            timestamp, generation = times[position], generations[position]
+            end = offsets[position + 1] if position + 1 < len(offsets) else None
+        # Read without the lock, which only serializes this process. Retention may delete the
+        # segment meanwhile, from the collecting process
+        try:
+            with open(self.__path(segment, "dat"), "rb") as file:
+                data = file.read() if end is None else file.read(end)
+        except FileNotFoundError:
+            return None
+
+        known = known or {}
+        table: Dict[str, LSA] = {}  # NLRI key -> LSA
+        offset = 0
+        for _ in range(position + 1):
+            kind, _, _, upserts, withdrawn = RECORD.unpack_from(data, offset)
+            offset += RECORD.size
+            lengths = struct.unpack_from(f"<{upserts}I", data, offset)
+            offset += 4 * upserts
+            if kind == KEYFRAME:
+                table.clear()
+            for length in lengths:
+                path = data[offset : offset + length]
+                offset += length
+                lsa = known.get(path) or records.from_bytes(path)
+                if lsa is not None:
+                    table[lsa.key] = lsa
+            for _ in range(withdrawn):
+                table.pop(data[offset : offset + 8].hex(), None)
+                offset += 8
+        return timestamp, generation, list(table.values())
+
+
+def parse_time(value: str) -> float:
+    """Parses epoch seconds, or an ISO 8601 date and time (UTC unless it says otherwise)
+
+    Raises:
+        ValueError: When value is neither
+    """
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    # fromisoformat() only takes a "Z" suffix from Python 3.11
+    moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
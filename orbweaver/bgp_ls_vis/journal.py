@@ -0,0 +1,170 @@
+"""Bounded journal of what moved between snapshot generations, for clients that follow deltas
+
+The journal only keeps the identity of what moved in each generation (the graphing.ChangeSet).
+A delta is materialised from the snapshot a client is being brought up to, so however many
+generations it spans, each node, link or prefix appears once, with its latest content.
+"""
+import asyncio
+import threading
+from collections import deque
+from .snapshot import Snapshot
+
+# ChangeSet attributes per kind of element, as (added, changed, removed)
+KINDS = {
+    "nodes": ("nodes_added", "nodes_changed", "nodes_removed"),
+    "links": ("links_added", "links_changed", "links_removed"),
+    "prefixes": ("prefixes_added", "prefixes_changed", "prefixes_removed"),
+}
+
+
+class ChangeJournal:
+    """Ring of the change sets of the last max_generations snapshots published"""
+
+    def __init__(self, max_generations: int = 1024):
+        """Constructor
+
+        Args:
+            max_generations: Generations to keep, clients further behind than this get a resync
+        """
+        self.__entries = deque(maxlen=max_generations)
+        self.__latest = 0
+        self.__condition = threading.Condition()
+        self.__waiters = set()  # (event loop, future) of wait_async() calls
+
+    def record(self, previous: int, snapshot: Snapshot):
+        """Journals a newly published snapshot
+
+        Args:
+            previous: Generation of the snapshot it replaced, generations may be skipped
+            snapshot: Snapshot just published, its changes are relative to previous
+        """
+        with self.__condition:
+            self.__entries.append((previous, snapshot.generation, snapshot.changes))
+            self.__latest = snapshot.generation
+            self.__condition.notify_all()
+            for loop, future in self.__waiters:
+                loop.call_soon_threadsafe(_wake, future)
+            self.__waiters.clear()
+
+    def wait(self, generation: int, timeout: float = None) -> bool:
+        """Blocks until a generation newer than generation is journaled
+
+        Returns:
+            False if timeout expired first
+        """
+        with self.__condition:
+            return self.__condition.wait_for(lambda: self.__latest > generation, timeout)
+
+    async def wait_async(self, generation: int, timeout: float = None) -> bool:
+        """Coroutine equivalent of wait(), that doesn't hold a thread while waiting"""
+        future = asyncio.get_running_loop().create_future()
+        waiter = (asyncio.get_running_loop(), future)
+        with self.__condition:
+            if self.__latest > generation:
+                return True
+            self.__waiters.add(waiter)
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self.__condition:
+                self.__waiters.discard(waiter)
+
+    def covers(self, since: int, snapshot: Snapshot) -> bool:
+        """True if a delta from generation since to snapshot can be had, see delta()"""
+        return self.__window(since, snapshot) is not None
+
+    def __window(self, since: int, snapshot: Snapshot) -> list:
+        """Entries between generation since and snapshot, None if the journal doesn't cover it"""
+        if since > snapshot.generation:
+            return None
+        with self.__condition:
+            entries = [entry for entry in self.__entries if since < entry[1] <= snapshot.generation]
+        # Entries may span several generations, one starting at or before since still covers it
+        if since < snapshot.generation and (not entries or entries[0][0] > since):
+            return None
+        return entries
+
+    def delta(self, since: int, snapshot: Snapshot) -> dict:
+        """What moved between generation since and snapshot
+
+        Args:
+            since: Generation the client last saw
+            snapshot: Snapshot to bring the client up to
+
+        Returns:
+            Dict with "since" and "generation", and per kind ("nodes", "links", "prefixes") a
+            dict of "added", "changed" and "removed". Added and changed elements carry their
+            content as in graph_to_dict(), prefixes as {"node", "key", "data"}, and removed ones
+            only their identity. Node elements carry no prefixes, those come as prefix deltas.
+            None when since is no longer (or was never) in the journal, the client then needs a
+            full resync
+        """
+        entries = self.__window(since, snapshot)
+        if entries is None:
+            return None
+
+        # First thing that happened to each element in the window, in order
+        first = {kind: {} for kind in KINDS}
+        for _, _, changes in entries:
+            for kind, names in KINDS.items():
+                for operation, name in zip(("added", "changed", "removed"), names):
+                    for item in getattr(changes, name):
+                        first[kind].setdefault(item, operation)
+
+        result = {"since": since, "generation": snapshot.generation}
+        for kind, operations in first.items():
+            result[kind] = {"added": [], "changed": [], "removed": []}
+            for item, operation in sorted(operations.items()):
+                content = _CONTENT[kind](snapshot, item)
+                if content is not None:
+                    result[kind]["added" if operation == "added" else "changed"].append(content)
+                elif operation != "added":
+                    result[kind]["removed"].append(_IDENTITY[kind](item))
+        return result
+
+
+def _wake(future: asyncio.Future):
+    """Resolves a wait_async() future, unless it timed out or was cancelled meanwhile"""
+    if not future.done():
+        future.set_result(None)
+
+
+def _node(snapshot: Snapshot, node: str) -> dict:
+    """Node element as in graph_to_dict() without its prefixes, None if gone"""
+    if node not in snapshot.graph:
+        return None
+    attributes = snapshot.graph.nodes[node]
+    element = {"id": node}
+    if "data" in attributes:
+        element["data"] = attributes["data"].to_dict()
+    return element
+
+
+def _link(snapshot: Snapshot, link: tuple) -> dict:
+    """Link element as in graph_to_dict(), None if gone"""
+    local, remote, key = link
+    if not snapshot.graph.has_edge(local, remote, key):
+        return None
+    element = dict(snapshot.graph.edges[local, remote, key], source=local, target=remote, key=key)
+    element["data"] = element["data"].to_dict()
+    return element
+
+
+def _prefix(snapshot: Snapshot, prefix: tuple) -> dict:
+    """Prefix element, None if gone"""
+    node, key = prefix
+    lsa = snapshot.lsas.get(key)
+    if lsa is None or lsa.router_id != node:
+        return None
+    return {"node": node, "key": key, "data": lsa.to_dict()}
+
+
+_CONTENT = {"nodes": _node, "links": _link, "prefixes": _prefix}
+_IDENTITY = {
+    "nodes": lambda node: node,
+    "links": lambda link: {"source": link[0], "target": link[1], "key": link[2]},
+    "prefixes": lambda prefix: {"node": prefix[0], "key": prefix[1]},
+}
@@ -1,10 +1,29 @@
 """Link-State Manager Class - Handles periodic updates and Flask endpoint logic"""
+import asyncio
+import contextlib
+import logging
+import queue
 import threading
 import time
+from collections import OrderedDict
+from typing import AsyncIterator, Iterator, Optional, Tuple
+import grpc
 import networkx
-from networkx.readwrite.json_graph import node_link_data
 from . import proto
+from . import csr
 from . import graphing
+from . import history
+from . import journal
+from . import merge
+from . import metrics
+from . import records
+from . import sharing
+from . import spf
+from .snapshot import Snapshot
+
+LOGGER = logging.getLogger(__name__)
+
+HISTORY_CACHE_SIZE = 8  # Snapshots rebuilt from history to keep
 
 
 class LinkStateManager:
@@ -16,58 +35,820 @@ class LinkStateManager:
         target_port: int = 50051,
         task: bool = True,
         polling_period: int = 3,  # seconds
+        watch: bool = False,
+        spf_cache_size: int = 1024,
+        spf_precompute_max_nodes: int = 0,
+        snapshot_file: str = None,
+        collect: bool = True,
+        serve: bool = True,
+        journal_size: int = 1024,
+        use_asyncio: bool = False,
+        grpc_timeout: float = 30,
+        watch_queue_size: int = 10000,
+        min_publish_interval: float = 0.5,
+        targets: list = None,
+        source_timeout: float = None,
+        stream_idle_timeout: float = 60,
+        history_dir: str = None,
+        history_keyframe_interval: int = 100,
+        history_retention: float = None,
     ):
-        """Constructor"""
-        self.rpc = proto.GoBGPQueryWrapper(
-            target_ipv4_address=target_ipv4_address,
-            target_rpc_port=target_port,
+        """Constructor
+
+        Args:
+            target_ipv4_address: Management IPv4 Address of GoBGP instance
+            target_port: Management Port of GoBGP Instance
+            task: When set false, will not start the background update thread
+            polling_period: Seconds between full table polls, or between re-subscribe attempts
+                when watching
+            watch: When set true, follows GoBGP's MonitorTable stream instead of polling
+            spf_cache_size: Shortest path trees to keep cached
+            spf_precompute_max_nodes: When the topology has no more nodes than this, the shortest
+                path tree from every node is computed in the background after each change
+            snapshot_file: When collecting, every snapshot published is also written to this file,
+                and what it holds on startup is served as stale until GoBGP is first heard from.
+                When not, snapshots are read from it instead of GoBGP
+            collect: When set false, GoBGP is never queried and snapshots are followed from
+                snapshot_file, as written by another process collecting for this one
+            serve: When set false, only collects for other processes to serve from, and shortest
+                path trees are never precomputed
+            journal_size: Generations of changes to keep, for clients following deltas
+            use_asyncio: When set true, GoBGP is queried by run_async() over grpc.aio rather than
+                from a thread
+            grpc_timeout: Seconds a full table dump may take, with use_asyncio
+            watch_queue_size: Events to buffer when watching with use_asyncio, beyond which
+                reading from GoBGP waits for them to be applied
+            min_publish_interval: When watching, seconds to wait after a snapshot is published
+                before publishing events that arrive next. Events are applied to the graph, and
+                the graph copied into a new snapshot, at most once per interval however busy the
+                stream
+            targets: (IPv4 address, port) of every GoBGP instance to collect from, in order of
+                precedence, instead of target_ipv4_address and target_port. See merge.LSDBMerger
+            source_timeout: Seconds after which a GoBGP instance that could not be polled, or
+                whose stream broke, stops contributing to the LSDB, as long as another instance
+                is fresh. Defaults to 3 polling periods
+            stream_idle_timeout: When watching, seconds without any event after which the stream
+                is dropped and the table fetched again, to find out whether GoBGP is still there.
+                Never if not set
+            history_dir: When set, every snapshot published while collecting is recorded to this
+                directory, and snapshot_at() looks up past ones from it. See history
+            history_keyframe_interval: Snapshots recorded as deltas between two full ones
+            history_retention: Seconds of history to keep, forever if not set
+        """
+        self.targets = {
+            f"{address}:{port}": (address, port)
+            for address, port in (targets or [(target_ipv4_address, target_port)])
+        }
+        self.sources = (
+            {
+                name: proto.GoBGPQueryWrapper(target_ipv4_address=address, target_rpc_port=port)
+                for name, (address, port) in self.targets.items()
+            }
+            if collect
+            else {}
+        )
+        # The highest precedence instance, kept for callers that only know of a single one
+        self.rpc = next(iter(self.sources.values()), None)
+        self.merger = merge.LSDBMerger(self.sources)
+        self.source_timeout = source_timeout or 3 * polling_period
+        self.stream_idle_timeout = stream_idle_timeout
+        self.__streaming = set()  # Sources with a MonitorTable stream up
+        self.__in_flight = {}  # Source -> when the fetch in progress from it started
+        self.__failing = set()  # Sources the last fetch from failed
+        self.__publish_lock = threading.RLock()
+        self.snapshot_file = sharing.SnapshotFile(snapshot_file) if snapshot_file else None
+        if not collect and not self.snapshot_file:
+            raise ValueError("A snapshot_file is required to follow snapshots without collecting")
+        self.polling_period = polling_period if collect else sharing.POLL_PERIOD
+        self.use_asyncio = use_asyncio and collect
+        self.grpc_timeout = grpc_timeout
+        self.watch_queue_size = watch_queue_size
+        self.min_publish_interval = min_publish_interval
+        self.watch = watch
+        self.__graph_updater = graphing.GraphUpdater()
+        self.spf = spf.SPFCache(max_trees=spf_cache_size)
+        self.spf_precompute_max_nodes = (
+            min(spf_precompute_max_nodes, spf_cache_size) if serve else 0
+        )
+        self.journal = journal.ChangeJournal(max_generations=journal_size)
+        self.history = (
+            history.TopologyHistory(history_dir, history_keyframe_interval, history_retention)
+            if history_dir
+            else None
+        )
+        # Generations recorded in history are never reused, even by a collector starting afresh
+        self.__first_generation = (
+            self.history.last_generation + 1 if self.history and collect else 0
         )
-        self.polling_period = polling_period
-        self.__update()
+        self.__history_lock = threading.Lock()
+        self.__history_cache = OrderedDict()  # Snapshots rebuilt from history, by generation
+        # GoBGP is first queried by task(), the constructor only ever reads snapshot_file so
+        # that Orbweaver comes up, and serves the last snapshot stored, even with GoBGP down
+        self.snapshot = Snapshot.empty()
+        if self.snapshot_file:
+            self.__follow()
         if task:
-            threading.Thread(target=self.task).start()
+            threading.Thread(target=self.task, daemon=True).start()
+
+    @classmethod
+    def from_config(cls, conf: dict, collect: bool = True, task: bool = True, serve: bool = True):
+        """Builds a LinkStateManager from the settings in config.yaml
+
+        Args:
+            conf: Parsed config.yaml
+            collect: See the constructor
+            task: See the constructor
+            serve: See the constructor
+        """
+        return cls(
+            target_ipv4_address=conf.get("gobgp_grpc_ip"),
+            target_port=conf.get("gobgp_grpc_port", 50051),
+            targets=[
+                (instance["ip"], instance.get("port", 50051))
+                for instance in conf.get("gobgp_instances") or []
+            ],
+            task=task,
+            polling_period=conf["update_interval"],
+            watch=conf.get("watch", False),
+            spf_cache_size=conf.get("spf_cache_size", 1024),
+            spf_precompute_max_nodes=conf.get("spf_precompute_max_nodes", 0),
+            snapshot_file=conf.get("snapshot_file"),
+            collect=collect,
+            serve=serve,
+            journal_size=conf.get("journal_size", 1024),
+            use_asyncio=conf.get("use_asyncio", False),
+            grpc_timeout=conf.get("grpc_timeout", 30),
+            min_publish_interval=conf.get("min_publish_interval", 0.5),
+            source_timeout=conf.get("source_timeout"),
+            stream_idle_timeout=conf.get("stream_idle_timeout", 60),
+            history_dir=conf.get("history_dir"),
+            history_keyframe_interval=conf.get("history_keyframe_interval", 100),
+            history_retention=conf.get("history_retention"),
+        )
+
+    @property
+    def lsdb(self) -> tuple:
+        """LSDB of the current snapshot, as a tuple of records.LSA"""
+        return self.snapshot.lsdb
+
+    @property
+    def graph(self) -> networkx.MultiDiGraph:
+        """Graph of the current snapshot"""
+        return self.snapshot.graph
+
+    def __update_source(self, source: str) -> Snapshot:
+        """Polls the full table of one GoBGP instance"""
+        with self.__fetching(source):
+            with metrics.phase("fetch"):
+                lsdb = self.sources[source].get_lsdb(known=self.merger.known(source))
+            return self.__publish(lsdb=lsdb, source=source)
+
+    @contextlib.contextmanager
+    def __fetching(self, source: str):
+        """Wraps fetching and publishing the full table of a GoBGP instance, see __heard_from()"""
+        if source not in self.__failing:
+            self.__in_flight[source] = time.time()
+        try:
+            yield
+        except BaseException:
+            self.__failing.add(source)
+            raise
+        else:
+            self.__failing.discard(source)
+        finally:
+            self.__in_flight.pop(source, None)
+
+    def __heard_from(self, source: str) -> float:
+        """When a GoBGP instance was last heard from, epoch time
+
+        That is when its table was last fetched, or when the fetch in progress started as long
+        as the one before it succeeded, so that a fetch slower than source_timeout isn't
+        mistaken for the instance going quiet until it has taken source_timeout itself.
+        """
+        return max(self.merger.updated(source) or 0, self.__in_flight.get(source, 0))
+
+    def __expire_stale(self):
+        """Stops GoBGP instances that went quiet from contributing to the LSDB
+
+        An instance is stale once it was last heard from more than source_timeout ago, without a
+        MonitorTable stream up. Stale instances are only expired while another one is fresh, so
+        that if all of them are unreachable the last known LSDB is kept.
+        """
+        now = time.time()
+        stale = {
+            source
+            for source in self.sources
+            if source not in self.__streaming
+            and now - self.__heard_from(source) > self.source_timeout
+        }
+        if len(stale) == len(self.sources):
+            return
+        for source in stale:
+            upserts, withdrawn = self.merger.expire(source)
+            if upserts or withdrawn:
+                LOGGER.warning("GoBGP %s is stale, failing over to the other instances", source)
+                self.__publish(upserts=upserts, withdrawn=withdrawn)
+
+    def get_sources(self) -> dict:
+        """Returns the freshness of every GoBGP instance collected from, see
+        merge.LSDBMerger.freshness(), plus whether its MonitorTable stream is up
+
+        When following, as the collector last shared it through the snapshot file.
+        """
+        if self.rpc is None:
+            return self.snapshot_file.read_sources()
+        freshness = self.merger.freshness()
+        for source, state in freshness.items():
+            state["streaming"] = source in self.__streaming
+        return freshness
+
+    def __follow(self) -> Snapshot:
+        """Picks up the latest snapshot from the snapshot file, if the collector wrote a new one
+
+        When collecting, this is only called on startup, to serve what a previous run stored.
+        """
+        try:
+            latest = self.snapshot_file.read()
+        except ValueError as err:
+            LOGGER.warning("Ignoring snapshot file: %s", err)
+            latest = None
+        if latest is not None:
+            generation, paths, stale = latest
+            # Paths already held are looked up straight from the mapped file, only new or changed
+            # ones are copied out and decoded
+            with metrics.phase("follow"):
+                known = {lsa.path: lsa for lsa in self.snapshot.lsdb}
+                lsdb = []
+                for path in paths:
+                    lsa = known.get(path)
+                    if lsa is None:
+                        lsa = records.from_bytes(bytes(path))
+                    if lsa is not None:
+                        lsdb.append(lsa)
+            if self.rpc is not None:
+                LOGGER.info("Serving %d stored LSAs until GoBGP is heard from", len(lsdb))
+            self.__publish(lsdb=lsdb, generation=generation, stale=stale or self.rpc is not None)
+        return self.snapshot
+
+    def __publish(
+        self,
+        lsdb: list = None,
+        upserts: list = (),
+        withdrawn: list = (),
+        generation: int = None,
+        source: str = None,
+        stale: bool = False,
+    ) -> Snapshot:
+        """Applies a full LSDB, or individual LSA changes, to the cached nx topology
+
+        Only the nodes, links and prefixes that moved are touched. When something did move, a
+        new Snapshot of the next generation is built from a copy of the updated graph and
+        published by replacing self.snapshot, which is the only thing Flask threads read.
+
+        Args:
+            lsdb: Full LSDB, as a list of records.LSA
+            upserts: LSAs added or replaced, when lsdb isn't given
+            withdrawn: LSAs withdrawn, when lsdb isn't given
+            generation: Generation to publish as, when following a collector. Generations only
+                ever go up, even if the collector restarts and counts from 1 again
+            source: GoBGP instance lsdb, upserts and withdrawn came from. They are then merged
+                with what other instances hold before being applied
+            stale: Whether lsdb is from a stored snapshot, see Snapshot. A snapshot is published
+                when this changes, even if the LSDB didn't
+        """
+        with self.__publish_lock:
+            return self.__publish_locked(lsdb, upserts, withdrawn, generation, source, stale)
 
-    def __update(self) -> networkx.Graph:
-        """Updates the cached nx topology by calling gRPC methods that query GoBGP for it's LSDB
-        then loading the content into a networkx graph object"""
-        self.lsdb = self.rpc.get_lsdb()
-        self.graph: networkx.Graph = graphing.build_nx_from_lsdb(self.lsdb)
-        return self.graph
+    def __publish_locked(self, lsdb, upserts, withdrawn, generation, source, stale) -> Snapshot:
+        """__publish(), with the lock held as GoBGP instances may be collected from concurrently"""
+        if source is not None:
+            metrics.SOURCE_UPDATED.labels(source).set_to_current_time()
+            with metrics.phase("merge"):
+                if lsdb is not None:
+                    upserts, withdrawn = self.merger.update(source, lsdb)
+                else:
+                    upserts, withdrawn = self.merger.apply(source, upserts, withdrawn)
+            # The first update from GoBGP replaces a stored snapshot outright, so that what was
+            # withdrawn since it was stored goes too
+            lsdb = self.merger.merged() if self.snapshot.stale else None
+        with metrics.phase("graph"):
+            if lsdb is not None:
+                changes = self.__graph_updater.update(lsdb)
+            else:
+                changes = self.__graph_updater.apply(upserts, withdrawn)
+        LOGGER.debug(
+            "LSDB updated, %d nodes, %d links, %d prefixes moved",
+            len(changes.nodes_added | changes.nodes_changed | changes.nodes_removed),
+            len(changes.links_added | changes.links_changed | changes.links_removed),
+            len(changes.prefixes_added | changes.prefixes_changed | changes.prefixes_removed),
+        )
+        if changes or stale != self.snapshot.stale:
+            previous = self.snapshot.generation
+            with metrics.phase("snapshot"):
+                self.snapshot = Snapshot(
+                    generation=max(
+                        generation or 0, self.snapshot.generation + 1, self.__first_generation
+                    ),
+                    lsdb=self.__graph_updater.lsdb,
+                    graph=self.__graph_updater.graph.copy(),
+                    changes=changes,
+                    stale=stale,
+                )
+            self.spf.invalidate(self.snapshot.generation)
+            self.journal.record(previous, self.snapshot)
+            if self.rpc is not None and self.snapshot_file:
+                with metrics.phase("share"):
+                    try:
+                        self.snapshot_file.write(self.snapshot)
+                    except OSError as err:
+                        LOGGER.error(
+                            "Failed to share generation %d through %s: %s",
+                            self.snapshot.generation,
+                            self.snapshot_file.filename,
+                            err,
+                        )
+            if self.rpc is not None and self.history and not stale:
+                with metrics.phase("history"):
+                    try:
+                        self.history.record(self.snapshot)
+                    except OSError as err:
+                        LOGGER.error(
+                            "Failed to record generation %d to history: %s",
+                            self.snapshot.generation,
+                            err,
+                        )
+            metrics.observe_snapshot(self.snapshot)
+            if len(self.snapshot.hosts) <= self.spf_precompute_max_nodes:
+                threading.Thread(
+                    target=self.spf.precompute, args=(self.snapshot, "igpMetric"), daemon=True
+                ).start()
+        return self.snapshot
 
     def task(self):
-        """Blocking task to be threaded, periodically updates the cached networkx graph object"""
+        """Blocking task to be threaded, keeps the cached networkx graph object up to date"""
+        if self.use_asyncio:
+            asyncio.run(self.run_async())
+            return
+        if self.rpc is None:
+            while True:
+                time.sleep(self.polling_period)
+                try:
+                    self.__follow()
+                except Exception:  # pylint: disable=broad-except
+                    LOGGER.exception("Following %s failed, retrying", self.snapshot_file.filename)
+        for source in self.sources:
+            threading.Thread(target=self.__collect, args=(source,), daemon=True).start()
         while True:
             time.sleep(self.polling_period)
-            self.__update()
+            self.__check_sources()
+
+    def __check_sources(self):
+        """Expires stale GoBGP instances and shares the freshness of all of them with followers,
+        logging rather than raising what fails, for the loop calling it to carry on"""
+        try:
+            self.__expire_stale()
+            if self.snapshot_file:
+                try:
+                    self.snapshot_file.write_sources(self.get_sources())
+                except OSError as err:
+                    LOGGER.error("Failed to share freshness of GoBGP instances: %s", err)
+        except Exception:  # pylint: disable=broad-except
+            LOGGER.exception("Checking GoBGP instances failed")
+
+    def __collect(self, source: str):
+        """Blocking, keeps the table of one GoBGP instance up to date"""
+        while True:
+            try:
+                if self.watch:
+                    self.__watch(source)
+                else:
+                    self.__update_source(source)
+            except grpc.RpcError as err:
+                LOGGER.warning("Query to GoBGP %s failed, retrying: %s", source, err)
+                metrics.REFRESH_ERRORS.labels(source).inc()
+            except Exception:  # pylint: disable=broad-except
+                # Anything else is a bug, but must not stop collecting from this instance
+                LOGGER.exception("Collecting from GoBGP %s failed, retrying", source)
+                metrics.REFRESH_ERRORS.labels(source).inc()
+            time.sleep(self.polling_period)
+
+    def __watch(self, source: str):
+        """Blocking, follows add/withdraw events from GoBGP and applies them to the cached LSDB
+
+        Events are read off the gRPC stream by a helper thread. Everything that has queued up
+        by the time one batch is applied goes into the next, as does what arrives until
+        min_publish_interval has passed since the last snapshot, so a burst of events costs a
+        single graph update and snapshot rather than one per path.
+
+        Returns when GoBGP closes the stream, or when it has been idle for stream_idle_timeout,
+        so that the caller can re-subscribe.
+
+        Args:
+            source: GoBGP instance to follow
+
+        Raises:
+            grpc.RpcError: When the stream to GoBGP breaks
+        """
+        with self.__fetching(source):
+            with metrics.phase("fetch"):
+                lsdb, events = self.sources[source].watch_lsdb(known=self.merger.known(source))
+            try:
+                self.__publish(lsdb, source=source)
+            except BaseException:
+                events.cancel()
+                raise
+
+        pending = queue.Queue()
+
+        def pump():
+            try:
+                for event in events:
+                    pending.put(event)
+                pending.put(None)  # GoBGP ended the stream cleanly
+            except grpc.RpcError as err:
+                pending.put(err)
+
+        threading.Thread(target=pump, daemon=True).start()
+
+        self.__streaming.add(source)
+        try:
+            while True:
+                try:
+                    batch = [pending.get(timeout=self.stream_idle_timeout)]
+                except queue.Empty:
+                    self.__log_idle(source)
+                    return
+                time.sleep(self.__publish_delay())
+                while not pending.empty():
+                    batch.append(pending.get_nowait())
+                if self.__apply_batch(batch, source):
+                    return
+        finally:
+            self.__streaming.discard(source)
+            events.cancel()
+
+    def __publish_delay(self) -> float:
+        """Seconds left of min_publish_interval since the current snapshot was published"""
+        return max(0, self.snapshot.created + self.min_publish_interval - time.time())
+
+    def __log_idle(self, source: str):
+        """Logs dropping a stream that went idle"""
+        LOGGER.info(
+            "No events from GoBGP %s in %ss, fetching its table again",
+            source,
+            self.stream_idle_timeout,
+        )
+
+    def __apply_batch(self, batch: list, source: str) -> bool:
+        """Publishes a batch of (is_withdraw, lsa) events as one update
+
+        A None in the batch marks the end of the stream, and an exception a broken stream. Events
+        before either are published first.
 
-    def get_hosts(self) -> list:
-        """Returns all nodes in the networkx graph, aka all link-state routers in the LSDB"""
-        return list(self.graph.nodes)
+        Returns:
+            True if the stream ended
 
-    def get_lsdb(self) -> list:
+        Raises:
+            Exception: The exception in the batch, if any
+        """
+        upserts, withdrawn, end, error = {}, {}, False, None
+        for event in batch:
+            if event is None or isinstance(event, BaseException):
+                end, error = True, event
+                break
+            is_withdraw, lsa = event
+            # Only the last event for each NLRI in a batch counts
+            upserts.pop(lsa.key, None)
+            withdrawn.pop(lsa.key, None)
+            (withdrawn if is_withdraw else upserts)[lsa.key] = lsa
+        self.__publish(
+            upserts=list(upserts.values()), withdrawn=list(withdrawn.values()), source=source
+        )
+        if error is not None:
+            raise error
+        return end
+
+    async def run_async(self):
+        """Coroutine keeping the cached networkx graph object up to date, over grpc.aio
+
+        What task() runs in its own event loop with use_asyncio. An async front end can instead
+        schedule it on its own loop, next to the coroutines serving clients, see follow_async().
+        Cancelling it cancels whatever RPC is in flight and closes the channels.
+
+        Publishing snapshots updates and copies the graph and writes files, so it runs in the
+        loop's default executor rather than on the loop, as does checking the GoBGP instances.
+        """
+        collectors = [asyncio.create_task(self.__collect_async(source)) for source in self.sources]
+        try:
+            while True:
+                await asyncio.sleep(self.polling_period)
+                await asyncio.to_thread(self.__check_sources)
+        finally:
+            for collector in collectors:
+                collector.cancel()
+            await asyncio.gather(*collectors, return_exceptions=True)
+
+    async def __collect_async(self, source: str):
+        """Coroutine equivalent of __collect()"""
+        client = proto.AsyncGoBGPQueryWrapper(*self.targets[source], timeout=self.grpc_timeout)
+        try:
+            while True:
+                try:
+                    if self.watch:
+                        await self.__watch_async(client, source)
+                    else:
+                        with self.__fetching(source):
+                            with metrics.phase("fetch"):
+                                lsdb = await client.get_lsdb(known=self.merger.known(source))
+                            await asyncio.to_thread(self.__publish, lsdb=lsdb, source=source)
+                except grpc.RpcError as err:
+                    LOGGER.warning("Query to GoBGP %s failed, retrying: %s", source, err)
+                    metrics.REFRESH_ERRORS.labels(source).inc()
+                except Exception:  # pylint: disable=broad-except
+                    LOGGER.exception("Collecting from GoBGP %s failed, retrying", source)
+                    metrics.REFRESH_ERRORS.labels(source).inc()
+                await asyncio.sleep(self.polling_period)
+        finally:
+            await client.close()
+
+    async def __watch_async(self, client: proto.AsyncGoBGPQueryWrapper, source: str):
+        """Coroutine equivalent of __watch(), events are read off the stream by a second task
+
+        The two tasks are coupled by a queue of watch_queue_size events. When it fills up, the
+        reading task stops reading and gRPC flow control pushes back on GoBGP, rather than events
+        piling up in memory while graph updates lag behind.
+        """
+        with self.__fetching(source):
+            with metrics.phase("fetch"):
+                lsdb, events = await client.watch_lsdb(known=self.merger.known(source))
+            try:
+                await asyncio.to_thread(self.__publish, lsdb, source=source)
+            except BaseException:
+                events.cancel()
+                raise
+
+        pending = asyncio.Queue(maxsize=self.watch_queue_size)
+
+        async def pump():
+            try:
+                async for event in events:
+                    await pending.put(event)
+                await pending.put(None)
+            except grpc.RpcError as err:
+                await pending.put(err)
+
+        reader = asyncio.create_task(pump())
+        self.__streaming.add(source)
+        try:
+            while True:
+                # Not asyncio.wait_for(), which before Python 3.12 can swallow this task being
+                # cancelled when the get completes at the same time
+                getter = asyncio.ensure_future(pending.get())
+                try:
+                    await asyncio.wait((getter,), timeout=self.stream_idle_timeout)
+                finally:
+                    getter.cancel()
+                if not getter.done():
+                    self.__log_idle(source)
+                    return
+                batch = [getter.result()]
+                await asyncio.sleep(self.__publish_delay())
+                while not pending.empty():
+                    batch.append(pending.get_nowait())
+                if await asyncio.to_thread(self.__apply_batch, batch, source):
+                    return
+        finally:
+            self.__streaming.discard(source)
+            reader.cancel()
+            events.cancel()
+
+    def snapshot_at(self, when: float) -> Optional[Snapshot]:
+        """The snapshot that was current at a point in time, rebuilt from history
+
+        The last few rebuilt are kept, and the current snapshot is returned as is when nothing
+        was recorded since. Getters answer from a rebuilt snapshot like from any other.
+
+        Args:
+            when: Epoch time
+
+        Returns:
+            Snapshot, with the generation and creation time it was recorded with, None when
+            history isn't kept or starts later
+        """
+        if self.history is None:
+            return None
+        found = self.history.lookup(when)
+        if found is None:
+            return None
+        timestamp, generation = found
+        current = self.snapshot
+        if generation == current.generation:
+            return current
+        with self.__history_lock:
+            snapshot = self.__history_cache.get(generation)
+            if snapshot is None:
+                with metrics.phase("history"):
+                    # LSAs that didn't change since are taken from the current snapshot
+                    known = {lsa.path: lsa for lsa in current.lsdb}
+                    rebuilt = self.history.lsdb_at(timestamp, known)
+                    if rebuilt is None:  # Expired since looked up
+                        return None
+                    lsdb = rebuilt[2]
+                    updater = graphing.GraphUpdater()
+                    updater.update(lsdb)
+                    snapshot = Snapshot(
+                        generation,
+                        updater.lsdb,
+                        updater.graph,
+                        graphing.ChangeSet(),
+                        created=timestamp,
+                    )
+                self.__history_cache[generation] = snapshot
+                while len(self.__history_cache) > HISTORY_CACHE_SIZE:
+                    self.__history_cache.popitem(last=False)
+            self.__history_cache.move_to_end(generation)
+        return snapshot
+
+    def get_hosts(self, snapshot: Snapshot = None) -> list:
+        """Returns all nodes in the networkx graph, aka all link-state routers in the LSDB
+
+        Args:
+            snapshot: Snapshot to answer from, defaults to the current one. Pass the same snapshot
+                to every call made while serving one request to get a consistent view
+        """
+        return list((snapshot or self.snapshot).hosts)
+
+    def get_lsdb(self, snapshot: Snapshot = None) -> list:
         """Returns the full LSDB as gleaned from the BGP-LS table in GoBGP"""
-        return self.lsdb
+        return [lsa.to_dict() for lsa in (snapshot or self.snapshot).lsdb]
 
-    def get_graph(self) -> dict:
+    def get_graph(self, snapshot: Snapshot = None) -> dict:
         """Returns the cached NetworkX graph object as JSON"""
-        return node_link_data(self.graph)
-
-    def get_shortest_path(self, source_node: str, target_node: str) -> dict:
-        """Shortest path between two node names"""
-        return networkx.shortest_path(
-            G=self.graph,
-            source=source_node,
-            target=target_node,
-            method="dijkstra",
-            weight="igpMetric",
-        )
+        return graphing.graph_to_dict((snapshot or self.snapshot).graph)
+
+    def get_columnar_graph(self, snapshot: Snapshot = None, columns: list = None) -> dict:
+        """Returns the cached NetworkX graph object as node and link tables, see
+        graphing.columnar_graph()
+
+        Args:
+            snapshot: Snapshot to answer from, defaults to the current one
+            columns: Attribute columns to include, all of them if not given
+        """
+        return graphing.columnar_graph((snapshot or self.snapshot).graph, columns)
+
+    def get_graph_table(self, table: str, snapshot: Snapshot = None) -> dict:
+        """Returns the nodes or links of the cached NetworkX graph object as columns
+
+        Args:
+            table: "nodes" or "links", see graphing.node_table() and graphing.link_table()
+            snapshot: Snapshot to answer from, defaults to the current one
+        """
+        graph = (snapshot or self.snapshot).graph
+        return graphing.node_table(graph) if table == "nodes" else graphing.link_table(graph)
 
-    def get_shortest_path_subgraph(self, source_node: str, target_node: str) -> dict:
-        nodes_in_spf = networkx.shortest_path(
-            G=self.graph,
-            source=source_node,
-            target=target_node,
-            method="dijkstra",
-            weight="igpMetric",
+    def get_shortest_path(
+        self,
+        source_node: str,
+        target_node: str,
+        snapshot: Snapshot = None,
+        weight: str = "igpMetric",
+    ) -> dict:
+        """Shortest path between two node names, from the cached shortest path tree of source_node
+
+        Args:
+            source_node: Name of the node the path starts from
+            target_node: Name of the node the path ends at
+            snapshot: Snapshot to answer from, defaults to the current one
+            weight: Link cost to minimise, one of graphing.LINK_WEIGHTS
+
+        Raises:
+            ValueError: When weight is not one of graphing.LINK_WEIGHTS
+            networkx.NodeNotFound: When source_node is not in the graph
+            networkx.NetworkXNoPath: When target_node is not reachable from source_node
+        """
+        if weight not in graphing.LINK_WEIGHTS:
+            raise ValueError(
+                f"Unknown weight {weight}, expected one of {list(graphing.LINK_WEIGHTS)}"
+            )
+        tree = self.spf.tree(snapshot or self.snapshot, source_node, weight)
+        return tree.path_to(target_node)
+
+    def get_shortest_path_subgraph(
+        self,
+        source_node: str,
+        target_node: str,
+        snapshot: Snapshot = None,
+        weight: str = "igpMetric",
+    ) -> dict:
+        snapshot = snapshot or self.snapshot
+        nodes_in_spf = self.get_shortest_path(source_node, target_node, snapshot, weight)
+        return graphing.graph_to_dict(snapshot.graph.subgraph(nodes=nodes_in_spf))
+
+    def get_k_shortest_paths(
+        self,
+        source_node: str,
+        target_node: str,
+        k: int = 3,
+        snapshot: Snapshot = None,
+        weight: str = "igpMetric",
+    ) -> list:
+        """Up to k loop-free paths between two node names, cheapest first
+
+        Args:
+            source_node: Name of the node the paths start from
+            target_node: Name of the node the paths end at
+            k: Most paths to return
+            snapshot: Snapshot to answer from, defaults to the current one
+            weight: Link cost to minimise, one of graphing.LINK_WEIGHTS
+
+        Returns:
+            List of {"cost": cost, "path": [node names]}, empty when target_node is unreachable
+
+        Raises:
+            ValueError: When weight is not one of graphing.LINK_WEIGHTS
+            networkx.NodeNotFound: When source_node or target_node is not in the graph
+        """
+        if weight not in graphing.LINK_WEIGHTS:
+            raise ValueError(
+                f"Unknown weight {weight}, expected one of {list(graphing.LINK_WEIGHTS)}"
+            )
+        topology = csr.for_snapshot(snapshot or self.snapshot)
+        return topology.k_shortest_paths(source_node, target_node, k, weight)
+
+    def get_reachable(self, source_node: str, snapshot: Snapshot = None) -> list:
+        """Names of every node reachable from source_node, source_node included
+
+        Raises:
+            networkx.NodeNotFound: When source_node is not in the graph
+        """
+        return csr.for_snapshot(snapshot or self.snapshot).reachable(source_node)
+
+    def get_diff(self, since: int, snapshot: Snapshot = None) -> dict:
+        """What moved in the graph since a generation the client last saw
+
+        Args:
+            since: Generation the client last saw
+            snapshot: Snapshot to answer from, defaults to the current one
+
+        Returns:
+            Delta from journal.ChangeJournal.delta() with "resync" false, or, when since is no
+            longer in the journal, {"generation", "resync": true, "graph"} with the full graph
+            as from get_graph()
+        """
+        snapshot = snapshot or self.snapshot
+        delta = self.__delta(since, snapshot)
+        if delta is None:
+            return {
+                "generation": snapshot.generation,
+                "resync": True,
+                "graph": self.get_graph(snapshot),
+            }
+        return dict(delta, resync=False)
+
+    def __delta(self, since: int, snapshot: Snapshot) -> Optional[dict]:
+        """journal.ChangeJournal.delta(), computed once per since and snapshot however many
+        clients ask for it. The dict returned is shared and must not be modified"""
+        if not self.journal.covers(since, snapshot):
+            return None
+        return snapshot.cached(
+            f"delta:{since}", lambda snapshot: self.journal.delta(since, snapshot)
         )
-        return node_link_data(self.graph.subgraph(nodes=nodes_in_spf))
+
+    def follow(
+        self, since: int = None, keepalive: float = 15
+    ) -> Iterator[Tuple[Snapshot, Optional[dict]]]:
+        """Yields the changes of every snapshot published from now on, for streaming to a client
+
+        Args:
+            since: Generation the client last saw, None for a client starting from nothing
+            keepalive: Seconds after which (None, None) is yielded if nothing was published, so
+                that the caller can check its client is still there
+
+        Yields:
+            (snapshot, delta) where delta is from journal.ChangeJournal.delta(), shared by every
+            client following and not to be modified, or None when the client needs a full resync
+            from snapshot. The first one is yielded straight away
+        """
+        snapshot = self.snapshot
+        delta = None if since is None else self.__delta(since, snapshot)
+        yield snapshot, delta
+        while True:
+            if not self.journal.wait(snapshot.generation, keepalive):
+                yield None, None
+                continue
+            previous, snapshot = snapshot, self.snapshot
+            yield snapshot, self.__delta(previous.generation, snapshot)
+
+    async def follow_async(
+        self, since: int = None, keepalive: float = 15
+    ) -> AsyncIterator[Tuple[Snapshot, Optional[dict]]]:
+        """Async generator equivalent of follow(), for async front ends"""
+        snapshot = self.snapshot
+        delta = None if since is None else self.__delta(since, snapshot)
+        yield snapshot, delta
+        while True:
+            if not await self.journal.wait_async(snapshot.generation, keepalive):
+                yield None, None
+                continue
+            previous, snapshot = snapshot, self.snapshot
+            yield snapshot, self.__delta(previous.generation, snapshot)
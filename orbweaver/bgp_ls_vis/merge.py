@@ -0,0 +1,145 @@
+"""Merging the BGP-LS tables of several GoBGP instances into one LSDB"""
+import threading
+import time
+from typing import Iterable, List, Tuple
+from .records import DIGEST_MASK, LSA, table_digest
+
+
+class LSDBMerger:
+    """Keeps the table of each source, and works out what their merge gains or loses on updates
+
+    An NLRI advertised by more than one source is taken from the first of them in order of
+    precedence, i.e. the order sources were given in. A source that has gone stale (see
+    expire()) no longer contributes, what it alone advertised is withdrawn and what others also
+    advertise is taken from them instead.
+
+    Every method returns (upserts, withdrawn) for GraphUpdater.apply(), only covering the NLRIs
+    whose merged LSA actually changed. The table of each source is also tracked by its
+    records.table_digest(), so a source that re-sends the same table is recognised by summing
+    digests, without building or comparing tables.
+    """
+
+    def __init__(self, sources: Iterable[str]):
+        """Constructor
+
+        Args:
+            sources: Source names, in order of precedence
+        """
+        self.sources = list(sources)
+        self.__tables = {source: {} for source in self.sources}  # source -> NLRI key -> LSA
+        self.__merged = {}  # NLRI key -> LSA
+        self.__updated = {source: None for source in self.sources}
+        self.__expired = {source: False for source in self.sources}
+        self.__digests = {source: table_digest(()) for source in self.sources}
+        self.__known = {source: None for source in self.sources}  # See known()
+        self.__lock = threading.Lock()
+
+    def update(self, source: str, lsdb: List[LSA]) -> Tuple[List[LSA], List[LSA]]:
+        """Replaces the whole table of a source"""
+        digest = table_digest(lsdb)
+        with self.__lock:
+            if digest == self.__digests[source] and not self.__expired[source]:
+                self.__updated[source] = time.time()
+                return [], []
+            table = {lsa.key: lsa for lsa in lsdb}
+            old_table = self.__tables[source]
+            keys = [key for key in table if old_table.get(key) != table[key]]
+            keys.extend(key for key in old_table if key not in table)
+            self.__tables[source] = table
+            # Recomputed from the table, lsdb may have held more than one path per NLRI
+            self.__digests[source] = table_digest(table.values())
+            self.__known[source] = None
+            return self.__refresh(source, keys)
+
+    def apply(
+        self, source: str, upserts: Iterable[LSA], withdrawn: Iterable[LSA]
+    ) -> Tuple[List[LSA], List[LSA]]:
+        """Applies individual adds/changes and withdraws to the table of a source"""
+        with self.__lock:
+            table = self.__tables[source]
+            digest = self.__digests[source]
+            keys = []
+            for lsa in withdrawn:
+                old_lsa = table.pop(lsa.key, None)
+                if old_lsa is not None:
+                    digest -= old_lsa.digest
+                    keys.append(lsa.key)
+            for lsa in upserts:
+                old_lsa = table.get(lsa.key)
+                if old_lsa != lsa:
+                    digest += lsa.digest - (old_lsa.digest if old_lsa is not None else 0)
+                    table[lsa.key] = lsa
+                    keys.append(lsa.key)
+            if keys:
+                self.__digests[source] = digest & DIGEST_MASK
+                self.__known[source] = None
+            return self.__refresh(source, keys)
+
+    def expire(self, source: str) -> Tuple[List[LSA], List[LSA]]:
+        """Stops a source from contributing until its next update() or apply()"""
+        with self.__lock:
+            if self.__expired[source]:
+                return [], []
+            self.__expired[source] = True
+            return self.__refresh(None, list(self.__tables[source]))
+
+    def freshness(self) -> dict:
+        """Returns, per source, when it was last updated (epoch time, None if never), whether it
+        is expired, how many NLRIs it holds and the digest of its table"""
+        with self.__lock:
+            return {
+                source: {
+                    "updated": self.__updated[source],
+                    "expired": self.__expired[source],
+                    "lsas": len(self.__tables[source]),
+                    "digest": f"{self.__digests[source]:016x}",
+                }
+                for source in self.sources
+            }
+
+    def merged(self) -> List[LSA]:
+        """Returns the merged LSDB, as a list of records.LSA"""
+        with self.__lock:
+            return list(self.__merged.values())
+
+    def known(self, source: str) -> dict:
+        """Returns the table of a source as a dict of serialized gobgp.Path to records.LSA, for
+        GoBGPQueryWrapper.get_lsdb() to skip decoding what it already holds
+
+        Built once per change to the table, not on every call. The dict must not be modified.
+        """
+        with self.__lock:
+            if self.__known[source] is None:
+                self.__known[source] = {lsa.path: lsa for lsa in self.__tables[source].values()}
+            return self.__known[source]
+
+    def updated(self, source: str) -> float:
+        """Epoch time a source was last updated, None if never"""
+        return self.__updated[source]
+
+    def __refresh(self, source: str, keys: list) -> Tuple[List[LSA], List[LSA]]:
+        """Re-merges the given NLRI keys, after the table of source (if any) was updated"""
+        if source is not None:
+            self.__updated[source] = time.time()
+            if self.__expired[source]:
+                # The source is back, everything it holds competes again
+                self.__expired[source] = False
+                keys = list(self.__tables[source])
+        upserts, withdrawn = [], []
+        for key in set(keys):
+            winner = next(
+                (
+                    self.__tables[name][key]
+                    for name in self.sources
+                    if not self.__expired[name] and key in self.__tables[name]
+                ),
+                None,
+            )
+            current = self.__merged.get(key)
+            if winner is None and current is not None:
+                del self.__merged[key]
+                withdrawn.append(current)
+            elif winner is not None and winner != current:
+                self.__merged[key] = winner
+                upserts.append(winner)
+        return upserts, withdrawn
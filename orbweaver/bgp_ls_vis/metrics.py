@@ -0,0 +1,92 @@
+"""Prometheus metrics for refreshes, the LSDB and the REST API
+
+Under gunicorn, PROMETHEUS_MULTIPROC_DIR is set (see gunicorn.conf.py) and metrics from the
+collector and every worker are aggregated on each scrape, whichever worker serves it.
+"""
+import os
+from typing import Tuple
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Refreshes of a large LSDB take seconds, the default buckets top out at 10
+PHASE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+REFRESH_PHASE_SECONDS = Histogram(
+    "orbweaver_refresh_phase_seconds",
+    "Time spent in each phase of an LSDB refresh",
+    ["phase"],
+    buckets=PHASE_BUCKETS,
+)
+REFRESH_ERRORS = Counter(
+    "orbweaver_refresh_errors_total", "Failed queries to a GoBGP instance", ["source"]
+)
+SOURCE_UPDATED = Gauge(
+    "orbweaver_source_last_update_timestamp_seconds",
+    "When a GoBGP instance was last heard from",
+    ["source"],
+    multiprocess_mode="max",
+)
+SNAPSHOT_GENERATION = Gauge(
+    "orbweaver_snapshot_generation", "Generation of the current snapshot", multiprocess_mode="max"
+)
+SNAPSHOT_CREATED = Gauge(
+    "orbweaver_snapshot_timestamp_seconds",
+    "When the current snapshot was published, i.e. the LSDB last changed",
+    multiprocess_mode="max",
+)
+SNAPSHOT_STALE = Gauge(
+    "orbweaver_snapshot_stale",
+    "1 while serving a stored snapshot, until GoBGP is first heard from",
+    multiprocess_mode="livemax",
+)
+LSDB_LSAS = Gauge("orbweaver_lsdb_lsas", "LSAs in the LSDB", ["type"], multiprocess_mode="livemax")
+GRAPH_NODES = Gauge("orbweaver_graph_nodes", "Nodes in the graph", multiprocess_mode="livemax")
+GRAPH_LINKS = Gauge("orbweaver_graph_links", "Links in the graph", multiprocess_mode="livemax")
+SERIALIZE_SECONDS = Histogram(
+    "orbweaver_serialize_seconds",
+    "Time spent serializing a cached response body, once per generation",
+    ["route"],
+    buckets=PHASE_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "orbweaver_request_duration_seconds",
+    "Time spent serving a request, until the response starts",
+    ["method", "route", "status"],
+)
+
+
+def phase(name: str):
+    """Context manager timing one phase of a refresh, e.g. `with metrics.phase("fetch"):`"""
+    return REFRESH_PHASE_SECONDS.labels(name).time()
+
+
+def observe_snapshot(snapshot):
+    """Updates the gauges describing the current snapshot"""
+    SNAPSHOT_GENERATION.set(snapshot.generation)
+    SNAPSHOT_CREATED.set(snapshot.created)
+    SNAPSHOT_STALE.set(int(snapshot.stale))
+    counts = {"LsNodeNLRI": 0, "LsLinkNLRI": 0, "LsPrefixV4NLRI": 0, "LsPrefixV6NLRI": 0}
+    for lsa in snapshot.lsdb:
+        counts[lsa.type] = counts.get(lsa.type, 0) + 1
+    for nlri_type, count in counts.items():
+        LSDB_LSAS.labels(nlri_type).set(count)
+    GRAPH_NODES.set(snapshot.graph.number_of_nodes())
+    GRAPH_LINKS.set(snapshot.graph.number_of_edges())
+
+
+def exposition() -> Tuple[bytes, str]:
+    """Returns every metric in Prometheus text format, and its Content-Type"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,14 +1,76 @@
 """gRPC tools and definitions"""
 # Standard Imports
-from json import loads, dumps
+from json import dumps, loads
+from typing import AsyncIterator, Iterator, Tuple
 import yaml
-from google.protobuf.json_format import MessageToDict
+from google.protobuf.json_format import MessageToDict, ParseDict
 
 # RPC & GoBGP imports
 import grpc
 from . import gobgp_pb2 as gobgp
 from . import gobgp_pb2_grpc
 from . import attribute_pb2
+from . import records
+from . import diagnostics
+
+# Pings on connections to GoBGP, so that streams from a GoBGP that vanished without closing them
+# break rather than hang. Not more often than GoBGP's gRPC server tolerates by default, 5 minutes
+CHANNEL_OPTIONS = [("grpc.keepalive_time_ms", 300000), ("grpc.keepalive_timeout_ms", 20000)]
+
+
+def build_rpc_request() -> gobgp.ListPathRequest:
+    """Builds a structured message for RPC query to get BGP-LS table
+
+    Returns:
+        gobgp.ListPathRequest: Structured message for RPC query
+    """
+    request = gobgp.ListPathRequest(
+        table_type=gobgp.LOCAL,
+        name="",
+        family=gobgp.Family(afi=gobgp.Family.AFI_LS, safi=gobgp.Family.SAFI_LS),
+        prefixes=None,
+        sort_type=True,
+    )
+    return request
+
+
+def build_monitor_request() -> gobgp.MonitorTableRequest:
+    """Builds a structured message for RPC query to stream changes to the BGP-LS table
+
+    Returns:
+        gobgp.MonitorTableRequest: Structured message for RPC query
+
+    Notes:
+        `current` is left unset, the existing table is fetched separately with ListPath
+    """
+    request = gobgp.MonitorTableRequest(
+        table_type=gobgp.GLOBAL,
+        name="",
+        family=gobgp.Family(afi=gobgp.Family.AFI_LS, safi=gobgp.Family.SAFI_LS),
+        current=False,
+    )
+    return request
+
+
+def lsas_from_destination(
+    destination: gobgp.Destination, best_only: bool, known: dict = None
+) -> Iterator[records.LSA]:
+    """Yields a records.LSA per path of a destination, best paths only if best_only
+
+    Args:
+        destination: Destination as received from GoBGP
+        best_only: Skip paths that aren't best paths
+        known: Dict of serialized gobgp.Path to records.LSA already decoded from it. Paths
+            found in it aren't decoded again, the known record is yielded instead
+    """
+    for path in destination.paths:
+        if best_only and not path.best:
+            continue
+        lsa = known.get(path.SerializeToString()) if known else None
+        if lsa is None:
+            lsa = records.from_path(path)
+        if lsa is not None:
+            yield lsa
 
 
 class GoBGPQueryWrapper:
@@ -30,119 +92,183 @@ class GoBGPQueryWrapper:
         Todo: Default parameters need some sanitation
         """
         if connect:
-            channel = grpc.insecure_channel(f"{target_ipv4_address}:{target_rpc_port}")
+            channel = grpc.insecure_channel(
+                f"{target_ipv4_address}:{target_rpc_port}", options=CHANNEL_OPTIONS
+            )
             self.stub = gobgp_pb2_grpc.GobgpApiStub(channel)
 
-    @staticmethod
-    def __build_rpc_request() -> gobgp.ListPathRequest:
-        """Builds a structured message for RPC query to get BGP-LS table
-
-        Returns:
-            gobgp.ListPathRequest: Structured message for RPC query
-        """
-        request = gobgp.ListPathRequest(
-            table_type=gobgp.LOCAL,
-            name="",
-            family=gobgp.Family(afi=gobgp.Family.AFI_LS, safi=gobgp.Family.SAFI_LS),
-            prefixes=None,
-            sort_type=True,
-        )
-        return request
-
-    def __get_bgp_ls_table(self) -> list:
+    def __get_bgp_ls_table(self) -> Iterator[gobgp.Destination]:
         """Submits RPC query (structured message) for BGP-LS table
 
         Sends gobgp.ListPathRequest object over RPC session to get BGP-LS NLRI objects
 
-        Returns:
-            List of NLRI objects for the BGP-LS AFI/SAFI
+        Yields:
+            gobgp.Destination objects for the BGP-LS AFI/SAFI, one at a time as GoBGP streams
+            them, so the table is never held as protobuf messages in full
 
         Notes:
-            To build required structured message, calls __build_rpc_request() first
+            To build required structured message, calls build_rpc_request() first
+        """
+        request = build_rpc_request()
+        for response in self.stub.ListPath(request):
+            yield response.destination
+
+    @staticmethod
+    def __load_bgp_ls_table(filename: str) -> Iterator[gobgp.Destination]:
+        """Loads a BGP-LS table from a YAML dump of what debug() returns
+
+        Yields:
+            gobgp.Destination objects, as if they had been received from GoBGP
         """
-        request = self.__build_rpc_request()
-        response = self.stub.ListPath(request)
-        rtn = [MessageToDict(nlri) for nlri in response]
-        return rtn
+        table = yaml.load(open(filename, "r"), Loader=yaml.Loader)
+        # Dump -> load as Json to cast the OrderedDicts in the dump to dict
+        for route in table:
+            yield ParseDict(loads(dumps(route["destination"])), gobgp.Destination())
 
     def debug(self) -> list:
         """Dumps the raw BGP-LS table received from GoBGP"""
-        return self.__get_bgp_ls_table()
+        return [{"destination": MessageToDict(route)} for route in self.__get_bgp_ls_table()]
+
+    def get_lsdb(self, best_only: bool = True, filename: str = None, known: dict = None) -> list:
+        """Gets the LSDB from the BGP-LS, including a gRPC call to GoBGP. LSDB can also be loaded from a file.
+
+        Destinations are decoded into records as they are streamed, so at most one of them is
+        held as protobuf messages at any time.
 
-    def get_lsdb(self, best_only: bool = True, filename: str = None) -> list:
-        """Gets the LSDB from the BGP-LS, including a gRPC call to GoBGP. LSDB can also be loaded from a file."""
+        Args:
+            best_only: Only keep best paths
+            filename: YAML dump to load the table from, instead of querying GoBGP
+            known: See lsas_from_destination(), pass the records of the previous LSDB to only
+                decode what changed since
+
+        Returns:
+            List of records.LSA, one per path
+        """
         # Get the whole brib for ls
         gobgp_ls_table = (
-            self.__get_bgp_ls_table()
-            if not filename
-            else yaml.load(open(filename, "r"), Loader=yaml.Loader)
+            self.__get_bgp_ls_table() if not filename else self.__load_bgp_ls_table(filename)
         )
 
         # Filter for only best-paths
-        b_rib = []
-        for route in gobgp_ls_table:
-            destination = route["destination"]
-            for path in destination["paths"]:
-                if best_only:
-                    if path["best"]:
-                        b_rib.append(path)
-                else:
-                    b_rib.append(path)
-
-        # Find and replace dict for ugly grpc naming convention
-        gapi_type_replace_lookup = {
-            "type.googleapis.com/gobgpapi.OriginAttribute": "OriginAttribute",
-            "type.googleapis.com/gobgpapi.AsPathAttribute": "AsPathAttribute",
-            "type.googleapis.com/gobgpapi.MultiExitDiscAttribute": "MultiExitDiscAttribute",
-            "type.googleapis.com/gobgpapi.LocalPrefAttribute": "LocalPrefAttribute",
-            "type.googleapis.com/gobgpapi.LsAttribute": "LsAttribute",
-            "type.googleapis.com/gobgpapi.MpReachNLRIAttribute": "MpReachNLRIAttribute",
-            "type.googleapis.com/gobgpapi.LsPrefixV4NLRI": "LsPrefixV4NLRI",
-            "type.googleapis.com/gobgpapi.LsLinkNLRI": "LsLinkNLRI",
-            "type.googleapis.com/gobgpapi.LsNodeNLRI": "LsNodeNLRI",
-        }
-
-        # If you load a nest of different types, some of which are collections.OrderedDict,
-        # you can recurse and cast these as dict ... or dump -> load it as Json to just
-        # cast them all
-        def remove_ordered_dicts(input_ordered_dict):
-            return loads(dumps(input_ordered_dict))
-
-        # If you want to replace keys and values in nested dicts, but dont want to recurse,
-        # json.dump then find/replace on the string, then load back to a dict
-        def replace_kv_in_dict(t_dict, item_to_be_replaced, replaced_with):
-            return loads(dumps(t_dict).replace(f'"{item_to_be_replaced}"', f'"{replaced_with}"'))
-
-        new_table = remove_ordered_dicts(b_rib)
-        new_table = replace_kv_in_dict(new_table, "@type", "type")
-        # Rename all keys using lookup dict gapi_type_replace_lookup
-        for old_key, new_key in gapi_type_replace_lookup.items():
-            new_table = replace_kv_in_dict(new_table, old_key, new_key)
-
-        # A list of single-item non-duplicate dicts is no-good, so flatten it
-        # Single item dicts have a key of 'type:', which is what we flatten on
-        for path in new_table:
-            pattrs_flat = {}
-            for pattr in path["pattrs"]:
-                pattrs_flat[pattr["type"]] = {}
-                for key, value in pattr.items():
-                    if key != "type":
-                        pattrs_flat[pattr["type"]][key] = value
-            path["pattrs"] = pattrs_flat
-
-        # Finally, we bring some values to the root to assist in various tasks (qol)
-        for path in new_table:
-            # IGP metric, for spf pathcalc
-            if path["nlri"]["nlri"]["type"] == "LsLinkNLRI":
-                path["igpMetric"] = path["pattrs"]["LsAttribute"]["link"]["igpMetric"]
-            # set key 'name' value to t137 value if it exits,
-            # else, set it to regular router-id (thats an nsap for isis)
-            # (note that the networkx node in the graph object is named by igpRouterId regardless)
-            if path["nlri"]["nlri"]["type"] == "LsNodeNLRI":
-                path["name"] = path["pattrs"]["LsAttribute"]["node"].get(
-                    "name", path["nlri"]["nlri"]["localNode"]["igpRouterId"]
-                )
-
-        print(yaml.dump(new_table))
+        new_table = []
+        for destination in gobgp_ls_table:
+            new_table.extend(lsas_from_destination(destination, best_only, known))
+
+        diagnostics.dump_lsdb(new_table)
 
         return new_table
+
+    def watch_lsdb(self, known: dict = None) -> Tuple[list, "WatchEvents"]:
+        """Gets the LSDB, and a stream of changes to it as they happen in GoBGP
+
+        Subscribes to the MonitorTable RPC before taking a full ListPath dump, so nothing that
+        changes between the two is missed. Events that raced the dump are replayed on top of it,
+        which is harmless as applying the same path twice gives the same result.
+
+        Args:
+            known: See get_lsdb()
+
+        Returns:
+            Tuple of (lsdb, events). lsdb as per get_lsdb(), events a WatchEvents
+
+        Notes:
+            Iterating events raises grpc.RpcError when the stream breaks, callers are expected to
+            call watch_lsdb() again to re-sync
+        """
+        stream = self.stub.MonitorTable(build_monitor_request())
+        try:
+            return self.get_lsdb(known=known), WatchEvents(stream)
+        except BaseException:
+            stream.cancel()
+            raise
+
+
+class WatchEvents:
+    """Iterator of (is_withdraw, lsa) tuples from a MonitorTable stream, lsa being a records.LSA
+
+    Iterated with async for when the stream is from a grpc.aio channel.
+    """
+
+    def __init__(self, stream):
+        """Constructor
+
+        Args:
+            stream: MonitorTable response stream
+        """
+        self.stream = stream
+
+    def __iter__(self) -> Iterator[Tuple[bool, records.LSA]]:
+        for response in self.stream:
+            lsa = records.from_path(response.path)
+            if lsa is not None:
+                yield response.path.is_withdraw, lsa
+
+    async def __aiter__(self) -> AsyncIterator[Tuple[bool, records.LSA]]:
+        async for response in self.stream:
+            lsa = records.from_path(response.path)
+            if lsa is not None:
+                yield response.path.is_withdraw, lsa
+
+    def cancel(self):
+        """Cancels the stream, from any thread. Iterating then raises grpc.RpcError"""
+        self.stream.cancel()
+
+
+class AsyncGoBGPQueryWrapper:
+    """asyncio counterpart of GoBGPQueryWrapper, over a grpc.aio channel
+
+    Must be constructed, used and closed from within the same running event loop.
+    """
+
+    def __init__(
+        self,
+        target_ipv4_address: str = "",
+        target_rpc_port: int = "",
+        timeout: float = 30,
+    ):
+        """Constructor initialises RPC session
+
+        Args:
+            target_ipv4_address: Management IPv4 Address of GoBGP instance
+            target_rpc_port: Management Port of GoBGP Instance
+            timeout: Seconds a full ListPath dump may take before it is cancelled
+        """
+        self.timeout = timeout
+        self.channel = grpc.aio.insecure_channel(
+            f"{target_ipv4_address}:{target_rpc_port}", options=CHANNEL_OPTIONS
+        )
+        self.stub = gobgp_pb2_grpc.GobgpApiStub(self.channel)
+
+    async def close(self):
+        """Closes the channel, cancelling any RPC still running on it"""
+        await self.channel.close()
+
+    async def get_lsdb(self, best_only: bool = True, known: dict = None) -> list:
+        """Gets the LSDB from the BGP-LS table in GoBGP, see GoBGPQueryWrapper.get_lsdb()
+
+        Raises:
+            grpc.RpcError: When the RPC fails, or takes longer than timeout
+        """
+        new_table = []
+        async for response in self.stub.ListPath(build_rpc_request(), timeout=self.timeout):
+            new_table.extend(lsas_from_destination(response.destination, best_only, known))
+
+        diagnostics.dump_lsdb(new_table)
+
+        return new_table
+
+    async def watch_lsdb(self, known: dict = None) -> Tuple[list, WatchEvents]:
+        """Gets the LSDB, and a stream of changes to it, see GoBGPQueryWrapper.watch_lsdb()
+
+        Events GoBGP sends while the LSDB is being dumped are held by gRPC flow control until
+        the returned iterator is read, as are events sent while the reader is busy.
+
+        Raises:
+            grpc.RpcError: When the RPC fails, also when iterating events
+        """
+        stream = self.stub.MonitorTable(build_monitor_request())
+        try:
+            return await self.get_lsdb(known=known), WatchEvents(stream)
+        except BaseException:
+            stream.cancel()
+            raise
@@ -0,0 +1,263 @@
+"""Compact LSA records, decoded straight from GoBGP's protobuf messages
+
+Records keep the handful of values Orbweaver works with as slots, plus the path they came from
+as serialized protobuf bytes. The dict view served over REST is only built from those bytes when
+asked for, with to_dict(), and not kept: bodies built from it are cached per snapshot instead.
+Paths of NLRI types the graph is not built from, e.g. LsPrefixV6NLRI, are kept as OtherLSA
+records, so that they are still served.
+
+Every record also carries a digest of its path, and a whole table is summed up by table_digest()
+of those, so that a table GoBGP sends again unchanged is recognised without comparing it path by
+path.
+"""
+import hashlib
+from typing import Iterable
+from google.protobuf.json_format import MessageToDict
+from . import gobgp_pb2 as gobgp
+from . import attribute_pb2
+
+
+# Find and replace dict for ugly grpc naming convention
+GAPI_TYPE_REPLACE_LOOKUP = {
+    "type.googleapis.com/gobgpapi.OriginAttribute": "OriginAttribute",
+    "type.googleapis.com/gobgpapi.AsPathAttribute": "AsPathAttribute",
+    "type.googleapis.com/gobgpapi.MultiExitDiscAttribute": "MultiExitDiscAttribute",
+    "type.googleapis.com/gobgpapi.LocalPrefAttribute": "LocalPrefAttribute",
+    "type.googleapis.com/gobgpapi.LsAttribute": "LsAttribute",
+    "type.googleapis.com/gobgpapi.MpReachNLRIAttribute": "MpReachNLRIAttribute",
+    "type.googleapis.com/gobgpapi.LsPrefixV4NLRI": "LsPrefixV4NLRI",
+    "type.googleapis.com/gobgpapi.LsPrefixV6NLRI": "LsPrefixV6NLRI",
+    "type.googleapis.com/gobgpapi.LsLinkNLRI": "LsLinkNLRI",
+    "type.googleapis.com/gobgpapi.LsNodeNLRI": "LsNodeNLRI",
+}
+
+DIGEST_MASK = (1 << 64) - 1
+
+
+def normalise_path(raw_path: dict) -> dict:
+    """Rewrites a path as received from GoBGP into the flattened format served by Orbweaver
+
+    Walks the path once, casting OrderedDicts to dict, renaming '@type' keys to 'type' and
+    shortening type URLs found in GAPI_TYPE_REPLACE_LOOKUP as it goes.
+
+    Args:
+        raw_path: Path as returned by MessageToDict, or loaded from a YAML dump of one
+
+    Returns:
+        Path with friendly type names, flattened pattrs and qol keys at the root
+    """
+    path = {}
+    for key, value in raw_path.items():
+        if key == "pattrs":
+            # A list of single-item non-duplicate dicts is no-good, so flatten it
+            # Single item dicts have a key of 'type:', which is what we flatten on
+            value = {}
+            for pattr in map(_normalise_value, raw_path["pattrs"]):
+                value[pattr.pop("type")] = pattr
+        else:
+            value = _normalise_value(value)
+        path[key] = value
+    path.setdefault("pattrs", {})
+
+    # Finally, we bring some values to the root to assist in various tasks (qol)
+    # (withdrawn paths carry no LsAttribute, so don't insist on one)
+    ls_attribute = path["pattrs"].get("LsAttribute", {})
+    # IGP metric, for spf pathcalc
+    if path["nlri"]["nlri"]["type"] == "LsLinkNLRI":
+        path["igpMetric"] = ls_attribute.get("link", {}).get("igpMetric")
+    # set key 'name' value to t137 value if it exits,
+    # else, set it to regular router-id (thats an nsap for isis)
+    # (note that the networkx node in the graph object is named by igpRouterId regardless)
+    if path["nlri"]["nlri"]["type"] == "LsNodeNLRI":
+        path["name"] = ls_attribute.get("node", {}).get(
+            "name", path["nlri"]["nlri"]["localNode"]["igpRouterId"]
+        )
+
+    return path
+
+
+def _normalise_value(value):
+    """Recursive helper for normalise_path()
+
+    Where a message has both '@type' and a 'type' field, whichever comes last wins. For
+    MessageToDict output that is always the 'type' field.
+    """
+    if isinstance(value, dict):
+        return {
+            ("type" if key == "@type" else key): _normalise_value(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [_normalise_value(item) for item in value]
+    if isinstance(value, str):
+        return GAPI_TYPE_REPLACE_LOOKUP.get(value, value)
+    return value
+
+
+class LSA:
+    """Base record for a single BGP-LS path
+
+    Attributes:
+        key: Identity of the NLRI, two records with the same key describe the same node, link or
+            prefix, so a newer one replaces an older one and a withdraw removes it
+        router_id: igpRouterId of the local node
+        asn: ASN of the local node
+        protocol: Protocol ID, as a name from LsProtocolID (e.g. LS_PROTOCOL_ISIS_L2)
+        digest: 64 bit hash of the path, equal for records decoded from identical paths
+        path: The gobgp.Path this record was decoded from, serialized
+    """
+
+    type = None
+    __slots__ = ("key", "router_id", "asn", "protocol", "digest", "path")
+
+    def __init__(self, prefix: attribute_pb2.LsAddrPrefix, nlri, path: bytes):
+        """Constructor, see from_path()"""
+        self.key = hashlib.blake2b(prefix.SerializeToString(), digest_size=8).hexdigest()
+        self.router_id = nlri.local_node.igp_router_id
+        self.asn = nlri.local_node.asn
+        try:
+            self.protocol = attribute_pb2.LsProtocolID.Name(prefix.protocol_id)
+        except ValueError:  # A protocol newer than the bundled gobgp_pb2
+            self.protocol = f"LS_PROTOCOL_{prefix.protocol_id}"
+        self.digest = int.from_bytes(hashlib.blake2b(path, digest_size=8).digest(), "little")
+        self.path = path
+
+    def __eq__(self, other) -> bool:
+        return type(self) is type(other) and self.digest == other.digest and self.path == other.path
+
+    def __hash__(self) -> int:
+        return self.digest
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.router_id}, key={self.key})"
+
+    def to_dict(self) -> dict:
+        """Returns the path this record was decoded from, in the format served over REST"""
+        return normalise_path(MessageToDict(gobgp.Path.FromString(self.path)))
+
+
+class NodeLSA(LSA):
+    """Record for an LsNodeNLRI path
+
+    Attributes:
+        name: Hostname (TLV 137) if advertised, else the igpRouterId
+    """
+
+    type = "LsNodeNLRI"
+    __slots__ = ("name",)
+
+    def __init__(self, prefix, nlri, path, ls_attribute: attribute_pb2.LsAttribute):
+        super().__init__(prefix, nlri, path)
+        self.name = ls_attribute.node.name or self.router_id
+
+
+class LinkLSA(LSA):
+    """Record for an LsLinkNLRI path
+
+    Attributes:
+        remote_router_id: igpRouterId of the remote node
+        local_address: Interface IPv4 address, empty if not advertised
+        remote_address: Neighbor IPv4 address, empty if not advertised
+        igp_metric: IGP metric of the link
+        te_metric: TE default metric of the link
+        bandwidth: Maximum link bandwidth, in bytes per second
+    """
+
+    type = "LsLinkNLRI"
+    __slots__ = (
+        "remote_router_id",
+        "local_address",
+        "remote_address",
+        "igp_metric",
+        "te_metric",
+        "bandwidth",
+    )
+
+    def __init__(self, prefix, nlri, path, ls_attribute: attribute_pb2.LsAttribute):
+        super().__init__(prefix, nlri, path)
+        self.remote_router_id = nlri.remote_node.igp_router_id
+        self.local_address = nlri.link_descriptor.interface_addr_ipv4
+        self.remote_address = nlri.link_descriptor.neighbor_addr_ipv4
+        self.igp_metric = ls_attribute.link.igp_metric
+        self.te_metric = ls_attribute.link.default_te_metric
+        self.bandwidth = ls_attribute.link.bandwidth
+
+
+class PrefixLSA(LSA):
+    """Record for an LsPrefixV4NLRI path
+
+    Attributes:
+        prefixes: IP reachability advertised, as a tuple of CIDR strings
+    """
+
+    type = "LsPrefixV4NLRI"
+    __slots__ = ("prefixes",)
+
+    def __init__(self, prefix, nlri, path, _ls_attribute: attribute_pb2.LsAttribute):
+        super().__init__(prefix, nlri, path)
+        self.prefixes = tuple(nlri.prefix_descriptor.ip_reachability)
+
+
+class OtherLSA(LSA):
+    """Record for a path of any other BGP-LS NLRI type, e.g. LsPrefixV6NLRI. Kept in the LSDB and
+    served over REST, but not part of the graph
+
+    Attributes:
+        type: Name of the NLRI type, e.g. LsPrefixV6NLRI
+    """
+
+    __slots__ = ("type",)
+
+    def __init__(self, prefix, nlri, path, _ls_attribute: attribute_pb2.LsAttribute):
+        super().__init__(prefix, nlri, path)
+        self.type = nlri.DESCRIPTOR.name
+
+
+NLRI_RECORDS = {
+    "gobgpapi.LsNodeNLRI": (attribute_pb2.LsNodeNLRI, NodeLSA),
+    "gobgpapi.LsLinkNLRI": (attribute_pb2.LsLinkNLRI, LinkLSA),
+    "gobgpapi.LsPrefixV4NLRI": (attribute_pb2.LsPrefixV4NLRI, PrefixLSA),
+}
+
+
+def from_path(path: gobgp.Path) -> LSA:
+    """Decodes a BGP-LS path into a record
+
+    Args:
+        path: Path as received from GoBGP
+
+    Returns:
+        NodeLSA, LinkLSA or PrefixLSA, OtherLSA for other BGP-LS NLRI types in the bundled
+        attribute_pb2, or None for NLRI types it doesn't define
+    """
+    prefix = attribute_pb2.LsAddrPrefix()
+    path.nlri.Unpack(prefix)
+    nlri_class, record_class = NLRI_RECORDS.get(prefix.nlri.TypeName(), (None, OtherLSA))
+    if nlri_class is None:
+        nlri_class = getattr(attribute_pb2, prefix.nlri.TypeName().rpartition(".")[2], None)
+        if nlri_class is None or "local_node" not in nlri_class.DESCRIPTOR.fields_by_name:
+            return None
+    nlri = nlri_class()
+    prefix.nlri.Unpack(nlri)
+
+    # Withdrawn paths carry no LsAttribute, an empty one reads as all defaults
+    ls_attribute = attribute_pb2.LsAttribute()
+    for pattr in path.pattrs:
+        if pattr.Is(attribute_pb2.LsAttribute.DESCRIPTOR):
+            pattr.Unpack(ls_attribute)
+
+    return record_class(prefix, nlri, path.SerializeToString(), ls_attribute)
+
+
+def from_bytes(data: bytes) -> LSA:
+    """Decodes a serialized gobgp.Path into a record, see from_path()"""
+    return from_path(gobgp.Path.FromString(data))
+
+
+def table_digest(lsdb: Iterable[LSA]) -> int:
+    """Digest of a whole table, the sum of the digests of its records modulo 2^64
+
+    The sum doesn't depend on the order paths were received in, and is kept up to date as
+    records come and go by adding and subtracting their digest, see merge.LSDBMerger.
+    """
+    return sum(lsa.digest for lsa in lsdb) & DIGEST_MASK
@@ -0,0 +1,179 @@
+"""Pre-serialized response bodies, cached per snapshot generation
+
+A body is serialized once per generation and format, and compressed at most once per
+content-encoding, no matter how many clients ask for it. Brotli is used when the `brotli`
+package is installed and the client accepts it, gzip otherwise.
+
+Besides JSON, bodies can be serialized as MessagePack, CBOR or, for tables, an Arrow IPC stream
+when the `msgpack`, `cbor2` or `pyarrow` package respectively is installed, see
+negotiate_format().
+"""
+import gzip
+import json
+import os
+import uuid
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+JSON = "application/json"
+MSGPACK = ("application/msgpack", "application/x-msgpack")
+CBOR = "application/cbor"
+ARROW = "application/vnd.apache.arrow.stream"
+
+# Generations restart from 0 with the process, so ETags are qualified with an instance ID. Worker
+# processes following one collector share theirs through the environment, see gunicorn.conf.py
+INSTANCE_ID = os.environ.get("ORBWEAVER_INSTANCE_ID") or uuid.uuid4().hex[:8]
+
+
+class CachedBody:
+    """A response body serialized from one snapshot, and its compressed variants
+
+    Attributes:
+        body: Uncompressed body
+        mimetype: Content-Type of body
+        etag: Weak ETag, identical for every compressed variant as they decode to the same body,
+            but not across formats
+    """
+
+    __slots__ = ("body", "mimetype", "etag", "__encoded")
+
+    def __init__(self, body: bytes, mimetype: str, generation: int):
+        """Constructor
+
+        Args:
+            body: Uncompressed body
+            mimetype: Content-Type of body
+            generation: Generation of the snapshot body was serialized from
+        """
+        self.body = body
+        self.mimetype = mimetype
+        if mimetype == JSON:
+            self.etag = f'W/"{INSTANCE_ID}-{generation}"'
+        else:
+            self.etag = f'W/"{INSTANCE_ID}-{generation}-{mimetype.rpartition("/")[2]}"'
+        self.__encoded = {None: body}
+
+    @classmethod
+    def json(cls, value, generation: int) -> "CachedBody":
+        """Serializes value as compact JSON"""
+        body = json.dumps(value, sort_keys=True, separators=(",", ":")).encode() + b"\n"
+        return cls(body, JSON, generation)
+
+    @classmethod
+    def serialize(cls, value, mimetype: str, generation: int) -> "CachedBody":
+        """Serializes value as JSON, MessagePack or CBOR
+
+        Args:
+            value: JSON-serializable value
+            mimetype: Format from negotiate_format(), other than ARROW
+            generation: Generation of the snapshot value was built from
+        """
+        if mimetype in MSGPACK:
+            return cls(msgpack.packb(value, use_bin_type=True), mimetype, generation)
+        if mimetype == CBOR:
+            return cls(cbor2.dumps(value), mimetype, generation)
+        return cls.json(value, generation)
+
+    @classmethod
+    def arrow(cls, columns: dict, generation: int) -> "CachedBody":
+        """Serializes a table as an Arrow IPC stream of a single record batch
+
+        Args:
+            columns: Dict of column name to list of values, column types are inferred from them
+            generation: Generation of the snapshot the table was built from
+        """
+        table = pyarrow.table(columns)
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=max(table.num_rows, 1))
+        return cls(sink.getvalue().to_pybytes(), ARROW, generation)
+
+    def encoded(self, encoding: str = None) -> bytes:
+        """Returns the body compressed with a content-encoding from negotiate_encoding()"""
+        if encoding not in self.__encoded:
+            if encoding == "br":
+                self.__encoded[encoding] = brotli.compress(self.body)
+            elif encoding == "gzip":
+                self.__encoded[encoding] = gzip.compress(self.body, compresslevel=6)
+            else:
+                raise ValueError(f"Unsupported content-encoding {encoding}")
+        return self.__encoded[encoding]
+
+
+def negotiate_format(accept, tables: bool = False) -> str:
+    """Picks the format to respond with, JSON unless the client prefers one that is installed
+
+    Args:
+        accept: Request's Accept header, as parsed by Flask into request.accept_mimetypes
+        tables: Whether the response can be a table, and so an Arrow IPC stream
+
+    Returns:
+        One of JSON, MSGPACK, CBOR or ARROW
+    """
+    offered = [JSON]
+    if msgpack is not None:
+        offered.extend(MSGPACK)
+    if cbor2 is not None:
+        offered.append(CBOR)
+    if tables and pyarrow is not None:
+        offered.append(ARROW)
+    return accept.best_match(offered, default=JSON)
+
+
+def negotiate_encoding(accept_encoding: str) -> str:
+    """Picks the content-encoding to respond with
+
+    Args:
+        accept_encoding: Value of the request's Accept-Encoding header
+
+    Returns:
+        'br', 'gzip', or None for no compression
+    """
+    accepted = set()
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(coding.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header matches an ETag, by weak comparison as HTTP requires
+
+    Args:
+        if_none_match: Value of the request's If-None-Match header, a list of ETags or *
+        etag: ETag of the response
+
+    Returns:
+        True if the header is * or lists etag, with or without W/ on either side
+    """
+    opaque = etag.removeprefix("W/")
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == opaque:
+            return True
+    return False
@@ -0,0 +1,153 @@
+"""Snapshot hand-off from one collector process to any number of worker processes, and from one
+run of Orbweaver to the next
+
+When Orbweaver is served by several worker processes, only the collector talks to GoBGP. It
+writes every snapshot it publishes to a file, and workers pick up each new generation from there
+rather than each polling GoBGP themselves. On startup, the collector serves whatever the file
+holds, flagged as stale, until GoBGP is first heard from.
+
+The file is a compact binary layout that workers mmap rather than read, all integers are little
+endian:
+
+    magic     8 bytes, b"OWSNAP2\\0"
+    generation  uint64
+    flags       uint32, FLAG_STALE if the snapshot is stale
+    count       uint32, number of paths
+    offsets     uint32 * (count + 1), offset of each path from the start of the data section,
+                the last one being the length of the data section
+    data        every serialized gobgp.Path, back to back
+
+Beside it, <snapshot file>.sources holds the freshness of every GoBGP instance, as JSON. It is
+rewritten every polling period, whereas the snapshot only is when the LSDB changes.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+from typing import List, Optional, Tuple
+
+LOGGER = logging.getLogger(__name__)
+
+# Seconds between checks of the snapshot file for a new generation, in workers
+POLL_PERIOD = 0.5
+
+MAGIC = b"OWSNAP2\0"
+HEADER = struct.Struct("<8sQII")
+FLAG_STALE = 1
+
+
+class SnapshotFile:
+    """File a collector publishes snapshots to and workers map them from
+
+    A snapshot is written to a temporary file in the same directory and renamed over the previous
+    one, so a reader only ever maps a complete snapshot, and a mapping it still holds stays valid
+    after the next snapshot is published.
+    """
+
+    def __init__(self, filename: str):
+        """Constructor
+
+        Args:
+            filename: Path of the snapshot file, its directory must be writable by the collector
+        """
+        self.filename = filename
+        self.__seen = None
+
+    def write(self, snapshot):
+        """Publishes a snapshot, as its generation, whether it is stale and the raw GoBGP path of
+        every LSA"""
+        paths = [lsa.path for lsa in snapshot.lsdb]
+        offsets = [0]
+        for path in paths:
+            offsets.append(offsets[-1] + len(path))
+        flags = FLAG_STALE if snapshot.stale else 0
+        self.__replace(
+            self.filename,
+            HEADER.pack(MAGIC, snapshot.generation, flags, len(paths)),
+            struct.pack(f"<{len(offsets)}I", *offsets),
+            b"".join(paths),
+        )
+
+    def mark_stale(self):
+        """Republishes the snapshot in the file as stale, for followers to flag what they serve
+        while no collector is running. It is published as the next generation, so that followers
+        pick it up, and the collector that takes over carries on counting from there"""
+        try:
+            with open(self.filename, "rb") as file:
+                data = bytearray(file.read())
+        except FileNotFoundError:
+            return
+        if len(data) < HEADER.size:
+            return
+        magic, generation, flags, count = HEADER.unpack_from(data)
+        if magic != MAGIC or flags & FLAG_STALE:
+            return
+        HEADER.pack_into(data, 0, MAGIC, generation + 1, flags | FLAG_STALE, count)
+        self.__replace(self.filename, data)
+
+    @property
+    def sources_filename(self) -> str:
+        """Path of the file freshness of GoBGP instances is shared through"""
+        return f"{self.filename}.sources"
+
+    def write_sources(self, sources: dict):
+        """Publishes the freshness of every GoBGP instance, see LinkStateManager.get_sources()"""
+        self.__replace(self.sources_filename, json.dumps(sources).encode())
+
+    def read_sources(self) -> dict:
+        """Returns the freshness of every GoBGP instance as last published, {} if never"""
+        try:
+            with open(self.sources_filename, "rb") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+    def __replace(self, filename: str, *chunks: bytes):
+        """Writes chunks to a temporary file, then renames it over filename"""
+        directory = os.path.dirname(os.path.abspath(filename))
+        handle, temporary = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+        try:
+            with os.fdopen(handle, "wb") as file:
+                for chunk in chunks:
+                    file.write(chunk)
+            os.replace(temporary, filename)
+        except OSError:
+            os.unlink(temporary)
+            raise
+
+    def read(self) -> Optional[Tuple[int, List[memoryview], bool]]:
+        """Returns the latest snapshot, if it was replaced since the last call
+
+        Returns:
+            Tuple of (generation, list of serialized gobgp.Path, stale), or None when the file is
+            unchanged or doesn't exist yet. Paths are read-only views into the mapped file, which
+            stays mapped for as long as any of them is referenced
+
+        Raises:
+            ValueError: When the file is not a snapshot file, or one written by another version
+        """
+        try:
+            stat = os.stat(self.filename)
+        except FileNotFoundError:
+            return None
+        if (stat.st_ino, stat.st_mtime_ns) == self.__seen:
+            return None
+        # Set first, so that a file found invalid is only reported once
+        self.__seen = (stat.st_ino, stat.st_mtime_ns)
+        if stat.st_size < HEADER.size:
+            raise ValueError(f"{self.filename} is not an Orbweaver snapshot file")
+        with open(self.filename, "rb") as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, generation, flags, count = HEADER.unpack_from(mapped)
+        if magic != MAGIC:
+            raise ValueError(f"{self.filename} is not an Orbweaver snapshot file")
+        view = memoryview(mapped)
+        start = HEADER.size + 4 * (count + 1)
+        offsets = struct.unpack_from(f"<{count + 1}I", mapped, HEADER.size)
+        paths = [view[start + offsets[i] : start + offsets[i + 1]] for i in range(count)]
+
+        LOGGER.debug("Mapped generation %d from %s", generation, self.filename)
+        return generation, paths, bool(flags & FLAG_STALE)
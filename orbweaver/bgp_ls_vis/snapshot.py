@@ -0,0 +1,91 @@
+"""Immutable, versioned snapshots of the LSDB and the graph built from it"""
+import time
+from typing import Callable
+import networkx as nx
+from .graphing import ChangeSet
+
+
+class Snapshot:
+    """The LSDB, its graph and anything derived from them, as of one generation
+
+    A snapshot is never modified once built. LinkStateManager publishes a new one by swapping a
+    single reference, so a reader that takes a snapshot once and works from it for a whole
+    request can't see a new LSDB with an old graph, or a graph halfway through an update.
+
+    Attributes:
+        generation: Increments by one every time the LSDB changes, 0 before the first fetch
+        created: Epoch time the snapshot was published
+        lsdb: Tuple of records.LSA
+        graph: Frozen NetworkX MultiDiGraph
+        changes: graphing.ChangeSet of what moved since the previous generation
+        hosts: Tuple of node names in the graph
+        lsas: Dict of NLRI key to records.LSA
+        stale: True until GoBGP was first heard from, while serving what was stored in the
+            snapshot file by a previous run, or nothing at all
+    """
+
+    __slots__ = (
+        "generation",
+        "created",
+        "lsdb",
+        "graph",
+        "changes",
+        "hosts",
+        "lsas",
+        "stale",
+        "__cache",
+    )
+
+    def __init__(
+        self,
+        generation: int,
+        lsdb,
+        graph: nx.MultiDiGraph,
+        changes: ChangeSet,
+        stale: bool = False,
+        created: float = None,
+    ):
+        """Constructor
+
+        Args:
+            generation: Generation number of this snapshot
+            lsdb: Iterable of records.LSA
+            graph: Graph built from lsdb. It is frozen in place, so pass a copy of any graph
+                that is still being updated
+            changes: What moved since the previous generation
+            stale: Whether lsdb is from a stored snapshot rather than from GoBGP
+            created: When the snapshot was published, now unless rebuilding one from history
+        """
+        self.generation = generation
+        self.created = created or time.time()
+        self.lsdb = tuple(lsdb)
+        self.graph = nx.freeze(graph)
+        self.changes = changes
+        self.hosts = tuple(graph.nodes)
+        self.lsas = {lsa.key: lsa for lsa in self.lsdb}
+        self.stale = stale
+        self.__cache = {}
+
+    @classmethod
+    def empty(cls) -> "Snapshot":
+        """Generation 0, served until the LSDB has been fetched for the first time"""
+        return cls(0, (), nx.MultiDiGraph(), ChangeSet(), stale=True)
+
+    def cached(self, name: str, producer: Callable[["Snapshot"], object]):
+        """Memoises something derived from this snapshot, e.g. a serialized response body
+
+        Args:
+            name: Unique name of what is derived
+            producer: Called with this snapshot to derive it, the first time name is asked for
+
+        Notes:
+            Two threads asking for the same name at once may both call producer, the result is
+            the same either way and one of them is kept
+        """
+        try:
+            return self.__cache[name]
+        except KeyError:
+            return self.__cache.setdefault(name, producer(self))
+
+    def __repr__(self) -> str:
+        return f"Snapshot(generation={self.generation}, lsdb={len(self.lsdb)} LSAs)"
@@ -0,0 +1,246 @@
+"""Shortest path trees, cached per snapshot generation and repaired incrementally between them"""
+import heapq
+import logging
+import math
+import threading
+from collections import OrderedDict
+from typing import Iterable, Tuple
+import networkx as nx
+from . import csr
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ShortestPathTree:
+    """Single-source shortest path tree, from one node to every node reachable from it
+
+    Attributes:
+        source: Node the tree is rooted at
+        weight: Edge attribute used as the cost of a link
+        distances: Dict of node to cost of the shortest path to it
+        predecessors: Dict of node to the list of nodes preceding it on equal cost shortest paths
+    """
+
+    __slots__ = ("source", "weight", "distances", "predecessors")
+
+    def __init__(self, source: str, weight: str, predecessors: dict, distances: dict):
+        """Constructor, see compute() and repair()"""
+        self.source = source
+        self.weight = weight
+        self.predecessors = predecessors
+        self.distances = distances
+
+    @classmethod
+    def compute(cls, graph: nx.Graph, source: str, weight: str) -> "ShortestPathTree":
+        """Runs Dijkstra from source over graph
+
+        Raises:
+            networkx.NodeNotFound: When source is not in graph
+        """
+        if source not in graph:
+            raise nx.NodeNotFound(f"Source {source} is not in G")
+        predecessors, distances = nx.dijkstra_predecessor_and_distance(graph, source, weight=weight)
+        return cls(source, weight, predecessors, distances)
+
+    @classmethod
+    def from_csr(cls, topology: csr.CSRGraph, source: str, weight: str) -> "ShortestPathTree":
+        """Runs Dijkstra from source over the array-backed copy of a graph, same result as
+        compute() on the graph it was built from but faster
+
+        Raises:
+            networkx.NodeNotFound: When source is not in topology
+        """
+        predecessors, distances = topology.shortest_path_tree(source, weight)
+        return cls(source, weight, predecessors, distances)
+
+    def repair(self, graph: nx.Graph, links: Iterable[Tuple[str, str]]) -> "ShortestPathTree":
+        """Returns the tree for graph, given this tree was computed before some links changed
+
+        Incremental SPF, as routers do it. Only nodes whose every shortest path ran over a link
+        that got worse or went down are detached and re-attached, and only nodes that a link
+        that got better or came up can now reach more cheaply are relaxed. Everything else in
+        the tree is kept as is.
+
+        Args:
+            graph: Graph after the change, with the same nodes except those only reachable over
+                the changed links
+            links: (local node, remote node) of every link added, removed or whose weight
+                changed. Parallel links between the same nodes count as the cheapest of them
+
+        Raises:
+            networkx.NodeNotFound: When the source is no longer in graph
+        """
+        if self.source not in graph:
+            raise nx.NodeNotFound(f"Source {self.source} is not in G")
+        distances = dict(self.distances)
+        predecessors = {node: list(preds) for node, preds in self.predecessors.items()}
+        links = set(links)
+
+        # Links that were on the tree and got worse, or went down, are taken off it
+        suspects = []
+        for local, remote in links:
+            if local in predecessors.get(remote, ()):
+                if distances[local] + self.__link_cost(graph, local, remote) > distances[remote]:
+                    predecessors[remote].remove(local)
+                    suspects.append(remote)
+
+        # Every node below those may have lost its way back to the source, except the source
+        # itself, which only has predecessors over zero cost cycles back to it
+        children = {}
+        for node, preds in predecessors.items():
+            for pred in preds:
+                children.setdefault(pred, []).append(node)
+        suspect = set()
+        while suspects:
+            node = suspects.pop()
+            if node not in suspect and node != self.source:
+                suspect.add(node)
+                suspects.extend(children.get(node, ()))
+
+        # Suspects are kept if a predecessor outside of them, or kept already, still leads back
+        # to the source. Merely having a predecessor left isn't enough, as nodes on a zero cost
+        # cycle are each other's predecessors
+        kept = [node for node in suspect if any(pred not in suspect for pred in predecessors[node])]
+        attached = set(kept)
+        while kept:
+            node = kept.pop()
+            for child in children.get(node, ()):
+                if child in suspect and child not in attached:
+                    attached.add(child)
+                    kept.append(child)
+        affected = suspect - attached
+        for node in attached | {self.source}:
+            predecessors[node] = [pred for pred in predecessors[node] if pred not in affected]
+        for node in affected:
+            del distances[node]
+            del predecessors[node]
+
+        # Re-attach affected nodes via their cheapest link from the intact part of the tree,
+        # and offer links that got better or came up, then let Dijkstra settle the rest
+        heap = []
+        for node in affected:
+            if node in graph:
+                for local in graph.predecessors(node):
+                    if local in distances:
+                        cost = distances[local] + self.__link_cost(graph, local, node)
+                        heapq.heappush(heap, (cost, node, local))
+        for local, remote in links:
+            if local in distances and remote in graph:
+                cost = distances[local] + self.__link_cost(graph, local, remote)
+                if cost <= distances.get(remote, math.inf):
+                    heapq.heappush(heap, (cost, remote, local))
+
+        while heap:
+            cost, node, local = heapq.heappop(heap)
+            if cost > distances.get(node, math.inf) or cost == math.inf:
+                continue
+            if cost < distances.get(node, math.inf):
+                distances[node] = cost
+                predecessors[node] = [local]
+            elif local not in predecessors[node]:
+                predecessors[node].append(local)
+                continue
+            else:
+                continue
+            for remote in graph.successors(node):
+                next_cost = cost + self.__link_cost(graph, node, remote)
+                if next_cost <= distances.get(remote, math.inf):
+                    heapq.heappush(heap, (next_cost, remote, node))
+
+        return ShortestPathTree(self.source, self.weight, predecessors, distances)
+
+    def __link_cost(self, graph: nx.Graph, local: str, remote: str) -> float:
+        """Cost of the cheapest link from local to remote, as networkx's Dijkstra sees it"""
+        if not graph.has_edge(local, remote):
+            return math.inf
+        if graph.is_multigraph():
+            return min(attrs.get(self.weight, 1) for attrs in graph[local][remote].values())
+        return graph[local][remote].get(self.weight, 1)
+
+    def path_to(self, target: str) -> list:
+        """Returns a shortest path from the source to target, as a list of nodes
+
+        Raises:
+            networkx.NetworkXNoPath: When target is not reachable from the source
+        """
+        if target not in self.distances:
+            raise nx.NetworkXNoPath(f"Node {target} not reachable from {self.source}")
+        path = [target]
+        while path[-1] != self.source:
+            path.append(self.predecessors[path[-1]][0])
+        path.reverse()
+        return path
+
+
+class SPFCache:
+    """LRU cache of ShortestPathTree objects, keyed by (snapshot generation, source, weight)
+
+    Once a tree has been computed for a source, the path to every destination from it is a walk
+    up the tree. When a tree is missing for a generation but cached for the one before, it is
+    repaired from the links in the snapshot's change set rather than computed from scratch.
+    Trees of older generations are dropped by invalidate(), or age out of the LRU. Trees of
+    snapshots neither current nor the one before, see LinkStateManager.snapshot_at(), are not
+    cached here.
+    """
+
+    def __init__(self, max_trees: int = 1024):
+        """Constructor
+
+        Args:
+            max_trees: Trees to keep before the least recently used is dropped
+        """
+        self.max_trees = max_trees
+        self.__trees = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__generation = 0
+
+    def tree(self, snapshot, source: str, weight: str) -> ShortestPathTree:
+        """Returns the shortest path tree from source in a snapshot, computing it if needed"""
+        if not self.__generation - 1 <= snapshot.generation <= self.__generation:
+            # Snapshots rebuilt from history are kept out of the LRU, and out of repairs as their
+            # change set is empty. The tree lives as long as the snapshot instead
+            return snapshot.cached(
+                f"spf:{source}:{weight}",
+                lambda snapshot: ShortestPathTree.from_csr(
+                    csr.for_snapshot(snapshot), source, weight
+                ),
+            )
+        key = (snapshot.generation, source, weight)
+        with self.__lock:
+            if key in self.__trees:
+                self.__trees.move_to_end(key)
+                return self.__trees[key]
+
+            previous = self.__trees.get((snapshot.generation - 1, source, weight))
+
+        if previous is not None:
+            changes = snapshot.changes
+            links = changes.links_added | changes.links_changed | changes.links_removed
+            tree = previous.repair(snapshot.graph, ((local, remote) for local, remote, _ in links))
+        else:
+            tree = ShortestPathTree.from_csr(csr.for_snapshot(snapshot), source, weight)
+        with self.__lock:
+            self.__trees[key] = tree
+            while len(self.__trees) > self.max_trees:
+                self.__trees.popitem(last=False)
+        return tree
+
+    def invalidate(self, generation: int):
+        """Makes generation the current one, dropping every tree computed for a generation older
+        than the one before it (those are kept to be repaired)"""
+        with self.__lock:
+            self.__generation = generation
+            for key in [key for key in self.__trees if key[0] < generation - 1]:
+                del self.__trees[key]
+
+    def precompute(self, snapshot, weight: str):
+        """Computes the tree from every node in a snapshot, i.e. all-pairs shortest paths
+
+        Only worth it while the snapshot has no more nodes than max_trees. Stops early if the
+        snapshot is superseded while running, see invalidate().
+        """
+        for source in snapshot.hosts:
+            if snapshot.generation < self.__generation:
+                return
+            self.tree(snapshot, source, weight)
+        LOGGER.debug("Precomputed all-pairs SPF for generation %d", snapshot.generation)
@@ -0,0 +1,134 @@
+"""Gunicorn settings for serving Orbweaver in production
+
+    $ gunicorn -c gunicorn.conf.py app:app
+
+One collector process queries GoBGP and writes every snapshot it publishes to `snapshot_file`.
+Each of the `workers` processes serves requests on `threads` threads, from the snapshots it picks
+up from that file, so GoBGP is queried once however many workers there are.
+
+The collector is run by a supervisor process rather than by the gunicorn master, which only
+looks after workers. The supervisor restarts the collector whenever it exits, and flags the
+snapshot in `snapshot_file` as stale until the new one takes over.
+"""
+import os
+import signal
+import tempfile
+import time
+import uuid
+import yaml
+
+CONF = yaml.safe_load(open("config.yaml", "r"))
+if not CONF.get("snapshot_file"):
+    raise SystemExit("snapshot_file must be set in config.yaml to run under gunicorn")
+
+bind = f"{CONF['flask_bind_ip']}:{CONF['flask_bind_port']}"
+workers = CONF.get("workers", 2)
+threads = CONF.get("threads", 4)
+worker_class = "gthread"
+
+# Inherited by the collector and every worker, see app.py and bgp_ls_vis/responses.py
+os.environ["ORBWEAVER_WORKER"] = "1"
+os.environ.setdefault("ORBWEAVER_INSTANCE_ID", uuid.uuid4().hex[:8])
+# Each process writes its metrics there, for /metrics to aggregate them, see bgp_ls_vis/metrics.py.
+# Must be set before prometheus_client is first imported, and empty on start
+if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="orbweaver-metrics-")
+
+SUPERVISOR = None
+# Seconds between a collector exiting and the next one starting, and between checks on it
+RESTART_DELAY = 1
+
+
+def collect():
+    """Collector process, keeps snapshot_file up to date from GoBGP until its supervisor is gone"""
+    # pylint: disable=import-outside-toplevel
+    from bgp_ls_vis import diagnostics
+    from bgp_ls_vis.lsm import LinkStateManager
+
+    diagnostics.configure(
+        level=CONF.get("log_level", "INFO"),
+        lsdb_dump_file=CONF.get("lsdb_dump_file"),
+    )
+    supervisor = os.getppid()
+    LinkStateManager.from_config(CONF, collect=True, task=True, serve=False)
+    while os.getppid() == supervisor:
+        time.sleep(RESTART_DELAY)
+
+
+def supervise(server):
+    """Supervisor process, runs the collector in a child process and restarts it when it exits
+
+    Exits, stopping the collector, on SIGTERM or once the gunicorn master is gone.
+    """
+    # pylint: disable=import-outside-toplevel
+    from prometheus_client import multiprocess
+    from bgp_ls_vis.sharing import SnapshotFile
+
+    master = os.getppid()
+    collector = None
+
+    def stop(signum, frame):  # pylint: disable=unused-argument
+        if collector:
+            try:
+                os.kill(collector, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        os._exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The master stops everything on Ctrl+C
+    while True:
+        collector = os.fork()
+        if collector == 0:
+            try:
+                collect()
+            finally:
+                os._exit(1)
+        server.log.info("Started collector (pid: %s)", collector)
+
+        pid = 0
+        while not pid:
+            time.sleep(RESTART_DELAY)
+            if os.getppid() != master:
+                stop(signal.SIGTERM, None)
+            pid, status = os.waitpid(collector, os.WNOHANG)
+        server.log.error(
+            "Collector (pid: %s) exited with status %s, restarting it",
+            collector,
+            os.waitstatus_to_exitcode(status),
+        )
+        multiprocess.mark_process_dead(collector)
+        try:
+            SnapshotFile(CONF["snapshot_file"]).mark_stale()
+        except OSError as err:
+            server.log.error("Failed to flag %s as stale: %s", CONF["snapshot_file"], err)
+
+
+def on_starting(server):
+    """Forks the collector's supervisor before any worker is forked"""
+    global SUPERVISOR  # pylint: disable=global-statement
+    SUPERVISOR = os.fork()
+    if SUPERVISOR == 0:
+        try:
+            supervise(server)
+        finally:
+            os._exit(1)
+    server.log.info("Started collector supervisor (pid: %s)", SUPERVISOR)
+
+
+def child_exit(server, worker):  # pylint: disable=unused-argument
+    """Drops the live gauges of a worker that exited from /metrics"""
+    # pylint: disable=import-outside-toplevel
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def on_exit(server):
+    """Stops the collector with the rest of Orbweaver"""
+    if SUPERVISOR:
+        server.log.info("Stopping collector supervisor (pid: %s)", SUPERVISOR)
+        try:
+            os.kill(SUPERVISOR, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
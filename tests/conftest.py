@@ -0,0 +1,43 @@
+"""Fixtures shared by the tests: the LSAs of the 18 node IS-IS topology dump, and new versions of
+them as GoBGP would send them when the network changes"""
+import os
+import sys
+import pytest
+
+# The bundled *_pb2.py modules predate protobuf 4, whose C++ implementation refuses them
+os.environ.setdefault("PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION", "python")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "orbweaver"))
+# pylint: disable=wrong-import-position
+from bgp_ls_vis import attribute_pb2
+from bgp_ls_vis import gobgp_pb2 as gobgp
+from bgp_ls_vis import records
+from bgp_ls_vis.proto import GoBGPQueryWrapper
+
+TOPOLOGY = os.path.join(os.path.dirname(__file__), "18-node-isis-w-bcast-segment.yaml")
+
+
+@pytest.fixture(scope="session")
+def lsdb() -> list:
+    """Records of every best path in the topology dump"""
+    return GoBGPQueryWrapper(connect=False).get_lsdb(filename=TOPOLOGY)
+
+
+@pytest.fixture(scope="session")
+def reissue():
+    """Function making another version of an LSA, for the same NLRI: a link with igp_metric as
+    its metric, anything else advertised again at another time"""
+
+    def reissued(lsa: records.LSA, igp_metric: int) -> records.LSA:
+        path = gobgp.Path.FromString(lsa.path)
+        if lsa.type == "LsLinkNLRI":
+            for pattr in path.pattrs:
+                if pattr.Is(attribute_pb2.LsAttribute.DESCRIPTOR):
+                    ls_attribute = attribute_pb2.LsAttribute()
+                    pattr.Unpack(ls_attribute)
+                    ls_attribute.link.igp_metric = igp_metric
+                    pattr.Pack(ls_attribute)
+        else:
+            path.age.seconds += igp_metric
+        return records.from_path(path)
+
+    return reissued
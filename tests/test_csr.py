@@ -0,0 +1,66 @@
+"""CSRGraph path computations against NetworkX, on random topologies with zero cost cycles"""
+import itertools
+import os
+import random
+import sys
+import networkx as nx
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "orbweaver"))
+from bgp_ls_vis.csr import CSRGraph  # pylint: disable=wrong-import-position
+from test_spf import WEIGHT, random_graph  # pylint: disable=wrong-import-position
+
+
+def cheapest_links(graph: nx.MultiDiGraph) -> nx.DiGraph:
+    """Graph with only the cheapest of parallel links, which is all paths are made of"""
+    simple = nx.DiGraph()
+    simple.add_nodes_from(graph)
+    for local, remote, cost in graph.edges(data=WEIGHT):
+        if not simple.has_edge(local, remote) or cost < simple[local][remote][WEIGHT]:
+            simple.add_edge(local, remote, **{WEIGHT: cost})
+    return simple
+
+
+def test_zero_cost_cycle_through_source():
+    graph = nx.MultiDiGraph()
+    graph.add_edge("s", "a", **{WEIGHT: 0})
+    graph.add_edge("a", "s", **{WEIGHT: 0})
+    graph.add_edge("a", "t", **{WEIGHT: 5})
+    csr = CSRGraph(graph, [WEIGHT])
+
+    assert csr.shortest_path("s", "t", WEIGHT) == ["s", "a", "t"]
+    assert csr.k_shortest_paths("s", "t", 3, WEIGHT) == [{"cost": 5, "path": ["s", "a", "t"]}]
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_paths_match_networkx(seed: int):
+    rng = random.Random(seed)
+    for _ in range(40):
+        graph = random_graph(rng)
+        csr = CSRGraph(graph, [WEIGHT])
+        simple = cheapest_links(graph)
+        source, target = rng.randrange(len(graph)), rng.randrange(len(graph))
+        distances = nx.single_source_dijkstra_path_length(graph, source, weight=WEIGHT)
+
+        if target not in distances:
+            with pytest.raises(nx.NetworkXNoPath):
+                csr.shortest_path(source, target, WEIGHT)
+            assert csr.k_shortest_paths(source, target, 4, WEIGHT) == []
+            continue
+        path = csr.shortest_path(source, target, WEIGHT)
+        assert path[0] == source and path[-1] == target
+        assert nx.path_weight(graph, path, WEIGHT) == distances[target]
+
+        expected = [
+            nx.path_weight(simple, path, WEIGHT)
+            for path in itertools.islice(
+                nx.shortest_simple_paths(simple, source, target, WEIGHT), 4
+            )
+        ]
+        paths = csr.k_shortest_paths(source, target, 4, WEIGHT)
+        assert [found["cost"] for found in paths] == expected
+        for found in paths:
+            assert found["path"][0] == source and found["path"][-1] == target
+            assert len(set(found["path"])) == len(found["path"])
+            assert nx.path_weight(graph, found["path"], WEIGHT) == found["cost"]
+        assert len({tuple(found["path"]) for found in paths}) == len(paths)
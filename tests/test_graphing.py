@@ -0,0 +1,89 @@
+"""GraphUpdater's incremental updates against a graph built from scratch, and the ChangeSet of
+each update against what actually moved"""
+import random
+import networkx as nx
+import pytest
+from bgp_ls_vis.graphing import GraphUpdater, build_nx_from_lsdb
+
+
+def graph_state(graph: nx.MultiDiGraph) -> tuple:
+    """Everything about a graph, prefixes as sets as their order depends on arrival"""
+    nodes = {
+        node: (attributes.get("data"), frozenset(attributes.get("prefixes", ())))
+        for node, attributes in graph.nodes(data=True)
+    }
+    links = {
+        (local, remote, key): dict(attributes)
+        for local, remote, key, attributes in graph.edges(keys=True, data=True)
+    }
+    return nodes, links
+
+
+def assert_changes(changes, before: tuple, after: tuple):
+    """Checks a ChangeSet against the state of the graph before and after the update"""
+    (nodes_before, links_before), (nodes_after, links_after) = before, after
+    assert changes.nodes_added == nodes_after.keys() - nodes_before.keys()
+    assert changes.nodes_removed == nodes_before.keys() - nodes_after.keys()
+    assert changes.nodes_changed == {
+        node
+        for node in nodes_before.keys() & nodes_after.keys()
+        if nodes_before[node][0] != nodes_after[node][0]
+    }
+    assert changes.links_added == links_after.keys() - links_before.keys()
+    assert changes.links_removed == links_before.keys() - links_after.keys()
+    assert changes.links_changed == {
+        link
+        for link in links_before.keys() & links_after.keys()
+        if links_before[link] != links_after[link]
+    }
+    prefixes_before = {(node, lsa.key): lsa for node, (_, ps) in nodes_before.items() for lsa in ps}
+    prefixes_after = {(node, lsa.key): lsa for node, (_, ps) in nodes_after.items() for lsa in ps}
+    assert changes.prefixes_added == prefixes_after.keys() - prefixes_before.keys()
+    assert changes.prefixes_removed == prefixes_before.keys() - prefixes_after.keys()
+    assert changes.prefixes_changed == {
+        prefix
+        for prefix in prefixes_before.keys() & prefixes_after.keys()
+        if prefixes_before[prefix] != prefixes_after[prefix]
+    }
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_apply_matches_build(seed: int, lsdb: list, reissue):
+    rng = random.Random(seed)
+    updater = GraphUpdater()
+    table = {}  # NLRI key -> LSA, what the graph should reflect
+    for _ in range(30):
+        upserts, withdrawn = {}, {}
+        for lsa in rng.sample(lsdb, rng.randint(1, 20)):
+            if lsa.key in table and rng.random() < 0.4:
+                withdrawn[lsa.key] = table[lsa.key]
+            else:
+                upserts[lsa.key] = lsa if rng.random() < 0.5 else reissue(lsa, rng.randint(1, 50))
+        before = graph_state(updater.graph)
+
+        changes = updater.apply(upserts.values(), withdrawn.values())
+        for key in withdrawn:
+            del table[key]
+        table.update(upserts)
+
+        assert graph_state(updater.graph) == graph_state(build_nx_from_lsdb(table.values()))
+        assert set(updater.lsdb) == set(table.values())
+        assert_changes(changes, before, graph_state(updater.graph))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_update_matches_build(seed: int, lsdb: list, reissue):
+    rng = random.Random(seed)
+    updater = GraphUpdater()
+    for _ in range(10):
+        table = [
+            lsa if rng.random() < 0.7 else reissue(lsa, rng.randint(1, 50))
+            for lsa in rng.sample(lsdb, rng.randint(0, len(lsdb)))
+        ]
+        before = graph_state(updater.graph)
+
+        changes = updater.update(table)
+
+        assert graph_state(updater.graph) == graph_state(build_nx_from_lsdb(table))
+        assert set(updater.lsdb) == set(table)
+        assert_changes(changes, before, graph_state(updater.graph))
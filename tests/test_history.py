@@ -0,0 +1,100 @@
+"""TopologyHistory's on-disk keyframes and deltas, read back as another process would, and its
+retention"""
+import math
+import os
+import random
+import networkx as nx
+import pytest
+from bgp_ls_vis.graphing import ChangeSet
+from bgp_ls_vis.history import TopologyHistory
+from bgp_ls_vis.snapshot import Snapshot
+
+
+def random_snapshots(rng: random.Random, lsdb: list, reissue, count: int, spacing: float):
+    """Snapshots of random changes to the LSDB, unchanged records carried over from one to the
+    next like LinkStateManager does, published spacing seconds apart"""
+    table = {lsa.key: lsa for lsa in rng.sample(lsdb, len(lsdb) // 2)}
+    for generation in range(1, count + 1):
+        if generation > 1:
+            for lsa in rng.sample(lsdb, rng.randint(1, 15)):
+                if lsa.key in table and rng.random() < 0.4:
+                    del table[lsa.key]
+                else:
+                    table[lsa.key] = reissue(lsa, rng.randint(1, 50))
+        yield Snapshot(
+            generation,
+            table.values(),
+            nx.MultiDiGraph(),
+            ChangeSet(),
+            created=1000.0 + spacing * generation,
+        )
+
+
+@pytest.mark.parametrize("keyframe_interval", [1, 3, 100])
+def test_round_trip(tmp_path, lsdb: list, reissue, keyframe_interval: int):
+    rng = random.Random(keyframe_interval)
+    writer = TopologyHistory(str(tmp_path), keyframe_interval)
+    recorded = list(random_snapshots(rng, lsdb, reissue, 30, 1.0))
+    for snapshot in recorded:
+        writer.record(snapshot)
+    # An index entry still being appended is ignored
+    with open(max(tmp_path.glob("*.idx")), "ab") as file:
+        file.write(b"\0" * 5)
+
+    reader = TopologyHistory(str(tmp_path))
+    assert len(list(tmp_path.glob("*.dat"))) == math.ceil(30 / (keyframe_interval + 1))
+    assert reader.last_generation == 30
+    assert reader.lookup(1000.5) is None and reader.lsdb_at(1000.5) is None
+    for snapshot in recorded:
+        for when in (snapshot.created, snapshot.created + 0.5):
+            assert reader.lookup(when) == (snapshot.created, snapshot.generation)
+            timestamp, generation, rebuilt = reader.lsdb_at(when)
+            assert (timestamp, generation) == (snapshot.created, snapshot.generation)
+            assert sorted(rebuilt, key=lambda lsa: lsa.key) == sorted(
+                snapshot.lsdb, key=lambda lsa: lsa.key
+            )
+
+    # Records already decoded are reused, not decoded again
+    known = {lsa.path: lsa for lsa in recorded[-1].lsdb}
+    _, _, rebuilt = reader.lsdb_at(recorded[-1].created, known)
+    assert all(known[lsa.path] is lsa for lsa in rebuilt)
+
+    # A collector starting afresh carries on with a keyframe of its own
+    restarted = TopologyHistory(str(tmp_path), keyframe_interval)
+    snapshot = Snapshot(31, lsdb, nx.MultiDiGraph(), ChangeSet(), created=2000.0)
+    restarted.record(snapshot)
+    assert os.path.exists(tmp_path / f"{31:020d}.dat")
+    assert set(reader.lsdb_at(2000.0)[2]) == set(lsdb)
+    assert reader.lsdb_at(1999.0)[1] == 30
+
+
+def test_retention(tmp_path, lsdb: list, reissue):
+    rng = random.Random(0)
+    writer = TopologyHistory(str(tmp_path), keyframe_interval=2, retention=10)
+    reader = TopologyHistory(str(tmp_path))
+    recorded = list(random_snapshots(rng, lsdb, reissue, 30, 1.0))
+    for snapshot in recorded:
+        writer.record(snapshot)
+
+    # Segments are deleted a keyframe at a time, when the next keyframe is recorded, and only
+    # once what they cover is all older than retention
+    last_keyframe = recorded[27].created
+    for snapshot in recorded:
+        found = reader.lsdb_at(snapshot.created)
+        if snapshot.created >= last_keyframe - 10:
+            assert found[1] == snapshot.generation
+            assert set(found[2]) == set(snapshot.lsdb)
+        elif snapshot.created < last_keyframe - 13:
+            assert found is None
+    assert reader.last_generation == 30
+
+
+def test_segment_deleted_while_looked_up(tmp_path, lsdb: list, reissue):
+    writer = TopologyHistory(str(tmp_path), keyframe_interval=2)
+    for snapshot in random_snapshots(random.Random(0), lsdb, reissue, 3, 1.0):
+        writer.record(snapshot)
+    reader = TopologyHistory(str(tmp_path))
+    assert reader.lookup(1002.0) == (1002.0, 2)
+    # Retention, in the collector, deletes the data file after the index was read here
+    (tmp_path / f"{1:020d}.dat").unlink()
+    assert reader.lsdb_at(1002.0) is None
@@ -0,0 +1,101 @@
+"""ChangeJournal deltas: applied to what a client holds as of one generation, they give exactly
+what it would get from a full resync to another"""
+import random
+import pytest
+from bgp_ls_vis.graphing import GraphUpdater
+from bgp_ls_vis.journal import ChangeJournal
+from bgp_ls_vis.snapshot import Snapshot
+
+
+def client_state(snapshot: Snapshot) -> dict:
+    """What a client resyncing to a snapshot holds, per kind of element by identity"""
+    graph = snapshot.graph
+    return {
+        "nodes": {
+            node: attributes["data"].to_dict() if "data" in attributes else None
+            for node, attributes in graph.nodes(data=True)
+        },
+        "links": {
+            (local, remote, key): dict(
+                attributes, source=local, target=remote, key=key, data=attributes["data"].to_dict()
+            )
+            for local, remote, key, attributes in graph.edges(keys=True, data=True)
+        },
+        "prefixes": {
+            (node, lsa.key): lsa.to_dict()
+            for node, attributes in graph.nodes(data=True)
+            for lsa in attributes.get("prefixes", ())
+        },
+    }
+
+
+IDENTITY = {
+    "nodes": lambda element: element if isinstance(element, str) else element["id"],
+    "links": lambda element: (element["source"], element["target"], element["key"]),
+    "prefixes": lambda element: (element["node"], element["key"]),
+}
+CONTENT = {
+    "nodes": lambda element: element.get("data"),
+    "links": lambda element: element,
+    "prefixes": lambda element: element["data"],
+}
+
+
+def apply_delta(state: dict, delta: dict) -> dict:
+    """Applies a delta to a client's state as a client would, checking that what is added is
+    new to it and what is changed or removed isn't"""
+    state = {kind: dict(elements) for kind, elements in state.items()}
+    for kind, elements in state.items():
+        for element in delta[kind]["removed"]:
+            del elements[IDENTITY[kind](element)]
+        for element in delta[kind]["added"]:
+            assert IDENTITY[kind](element) not in elements
+            elements[IDENTITY[kind](element)] = CONTENT[kind](element)
+        for element in delta[kind]["changed"]:
+            assert IDENTITY[kind](element) in elements
+            elements[IDENTITY[kind](element)] = CONTENT[kind](element)
+    return state
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_deltas_match_resync(seed: int, lsdb: list, reissue):
+    rng = random.Random(seed)
+    journal = ChangeJournal(max_generations=8)
+    updater = GraphUpdater()
+    snapshots = [Snapshot.empty()]
+    for _ in range(15):
+        upserts, withdrawn = {}, {}
+        for lsa in rng.sample(lsdb, rng.randint(1, 25)):
+            if lsa.key in snapshots[-1].lsas and rng.random() < 0.4:
+                withdrawn[lsa.key] = lsa
+            else:
+                upserts[lsa.key] = lsa if rng.random() < 0.5 else reissue(lsa, rng.randint(1, 50))
+        changes = updater.apply(upserts.values(), withdrawn.values())
+        # Generations may be skipped, e.g. by a collector taking over from another
+        generation = snapshots[-1].generation + rng.choice((1, 1, 2))
+        snapshots.append(Snapshot(generation, updater.lsdb, updater.graph.copy(), changes))
+        journal.record(snapshots[-2].generation, snapshots[-1])
+
+    states = {snapshot.generation: client_state(snapshot) for snapshot in snapshots}
+    covered = [snapshot.generation for snapshot in snapshots[-9:]]
+    for target in snapshots[-8:]:
+        for since in states:
+            delta = journal.delta(since, target)
+            if since not in covered or since > target.generation:
+                assert delta is None and not journal.covers(since, target)
+                continue
+            assert journal.covers(since, target)
+            assert (delta["since"], delta["generation"]) == (since, target.generation)
+            assert apply_delta(states[since], delta) == states[target.generation]
+
+
+def test_generations_skipped_within_an_entry(lsdb: list):
+    journal = ChangeJournal()
+    updater = GraphUpdater()
+    changes = updater.apply(lsdb)
+    snapshot = Snapshot(5, updater.lsdb, updater.graph.copy(), changes)
+    journal.record(2, snapshot)
+    # A client at a generation the entry spans was brought up to date by it
+    assert journal.covers(3, snapshot)
+    assert journal.delta(5, snapshot)["nodes"] == {"added": [], "changed": [], "removed": []}
+    assert not journal.covers(1, snapshot)
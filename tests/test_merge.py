@@ -0,0 +1,90 @@
+"""LSDBMerger against merging every source's table from scratch, over random updates, applies and
+expiries"""
+import random
+import pytest
+from bgp_ls_vis.merge import LSDBMerger
+from bgp_ls_vis.records import table_digest
+
+SOURCES = ["a:50051", "b:50051", "c:50051"]
+
+
+def expected_merge(tables: dict, expired: set) -> dict:
+    """NLRI key to LSA, each NLRI from the first source in order of precedence holding it"""
+    merged = {}
+    for source in reversed(SOURCES):
+        if source not in expired:
+            merged.update(tables[source])
+    return merged
+
+
+def test_precedence(lsdb: list, reissue):
+    merger = LSDBMerger(SOURCES)
+    first = [reissue(lsa, 12345) for lsa in lsdb[:50]]
+    merger.update("b:50051", lsdb)
+    upserts, withdrawn = merger.update("a:50051", first)
+    assert set(upserts) == set(first) and not withdrawn
+    assert set(merger.merged()) == set(first + lsdb[50:])
+
+    upserts, withdrawn = merger.expire("a:50051")
+    assert set(upserts) == set(lsdb[:50]) and not withdrawn
+    upserts, withdrawn = merger.expire("b:50051")
+    assert not upserts and set(withdrawn) == set(lsdb)
+    assert merger.merged() == []
+
+    # A source heard from again competes with everything it holds, not just what it re-sent
+    upserts, withdrawn = merger.apply("a:50051", [], [])
+    assert set(upserts) == set(first) and not withdrawn
+    assert merger.freshness()["a:50051"]["expired"] is False
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_operations(seed: int, lsdb: list, reissue):
+    rng = random.Random(seed)
+    merger = LSDBMerger(SOURCES)
+    tables = {source: {} for source in SOURCES}
+    expired = set()
+    merged = {}  # What the upserts and withdrawn returned so far add up to
+    for _ in range(60):
+        source = rng.choice(SOURCES)
+        operation = rng.random()
+        if operation < 0.15:
+            upserts, withdrawn = merger.expire(source)
+            expired.add(source)
+        elif operation < 0.45:
+            table = {}
+            for lsa in rng.sample(lsdb, rng.randint(0, len(lsdb))):
+                table[lsa.key] = lsa if rng.random() < 0.7 else reissue(lsa, rng.randint(1, 3))
+            if rng.random() < 0.2:
+                table = dict(tables[source])  # Sent again unchanged
+            upserts, withdrawn = merger.update(source, list(table.values()))
+            tables[source] = table
+            expired.discard(source)
+        else:
+            changed = rng.sample(lsdb, rng.randint(0, 10))
+            gone = [lsa for lsa in changed if lsa.key in tables[source] and rng.random() < 0.4]
+            new = [
+                lsa if rng.random() < 0.5 else reissue(lsa, rng.randint(1, 3))
+                for lsa in changed
+                if lsa not in gone
+            ]
+            upserts, withdrawn = merger.apply(source, new, gone)
+            for lsa in gone:
+                del tables[source][lsa.key]
+            tables[source].update((lsa.key, lsa) for lsa in new)
+            expired.discard(source)
+
+        expected = expected_merge(tables, expired)
+        assert {lsa.key for lsa in upserts}.isdisjoint(lsa.key for lsa in withdrawn)
+        assert all(merged.get(lsa.key) != lsa for lsa in upserts)
+        for lsa in withdrawn:
+            del merged[lsa.key]
+        merged.update((lsa.key, lsa) for lsa in upserts)
+        assert merged == expected
+        assert {lsa.key: lsa for lsa in merger.merged()} == expected
+
+        freshness = merger.freshness()
+        for name, table in tables.items():
+            assert freshness[name]["digest"] == f"{table_digest(table.values()):016x}"
+            assert freshness[name]["lsas"] == len(table)
+            assert freshness[name]["expired"] is (name in expired)
+            assert merger.known(name) == {lsa.path: lsa for lsa in table.values()}
@@ -0,0 +1,26 @@
+"""If-None-Match matching of cached bodies' ETags"""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "orbweaver"))
+from bgp_ls_vis.responses import etag_matches  # pylint: disable=wrong-import-position
+
+ETAG = 'W/"0a1b2c3d-42"'
+
+
+@pytest.mark.parametrize(
+    "if_none_match, matches",
+    [
+        ('W/"0a1b2c3d-42"', True),
+        ('"0a1b2c3d-42"', True),
+        ('"other", W/"0a1b2c3d-42"', True),
+        ("*", True),
+        ("", False),
+        ('W/"0a1b2c3d-4"', False),
+        ('W/"0a1b2c3d-420"', False),
+        ('W/"0a1b2c3d-42-msgpack"', False),
+    ],
+)
+def test_etag_matches(if_none_match: str, matches: bool):
+    assert etag_matches(if_none_match, ETAG) is matches
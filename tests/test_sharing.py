@@ -0,0 +1,71 @@
+"""SnapshotFile's binary format, written by the collector and mapped by workers"""
+import networkx as nx
+import pytest
+from bgp_ls_vis import records
+from bgp_ls_vis.graphing import ChangeSet
+from bgp_ls_vis.sharing import SnapshotFile
+from bgp_ls_vis.snapshot import Snapshot
+
+
+def snapshot(generation: int, lsdb: list, stale: bool = False) -> Snapshot:
+    """Snapshot of an LSDB, the graph isn't shared"""
+    return Snapshot(generation, lsdb, nx.MultiDiGraph(), ChangeSet(), stale=stale)
+
+
+def test_round_trip(tmp_path, lsdb: list, reissue):
+    filename = str(tmp_path / "orbweaver.snapshot")
+    collector, worker = SnapshotFile(filename), SnapshotFile(filename)
+    assert worker.read() is None
+
+    collector.write(snapshot(7, lsdb))
+    generation, paths, stale = worker.read()
+    assert (generation, stale) == (7, False)
+    assert [records.from_bytes(bytes(path)) for path in paths] == lsdb
+    assert worker.read() is None  # Unchanged since
+
+    changed = [reissue(lsa, 12345) for lsa in lsdb[:10]] + lsdb[20:]
+    collector.write(snapshot(8, changed, stale=True))
+    generation, new_paths, stale = worker.read()
+    assert (generation, stale) == (8, True)
+    assert [bytes(path) for path in new_paths] == [lsa.path for lsa in changed]
+    # Paths mapped from the snapshot before stay valid
+    assert [bytes(path) for path in paths] == [lsa.path for lsa in lsdb]
+
+    collector.write(snapshot(9, []))
+    assert worker.read() == (9, [], False)
+
+
+def test_mark_stale(tmp_path, lsdb: list):
+    filename = str(tmp_path / "orbweaver.snapshot")
+    collector, worker = SnapshotFile(filename), SnapshotFile(filename)
+    collector.mark_stale()  # Nothing published yet
+    assert worker.read() is None
+
+    collector.write(snapshot(3, lsdb))
+    worker.read()
+    collector.mark_stale()
+    generation, paths, stale = worker.read()
+    assert (generation, stale) == (4, True)
+    assert [bytes(path) for path in paths] == [lsa.path for lsa in lsdb]
+    collector.mark_stale()  # Already stale
+    assert worker.read() is None
+
+
+def test_not_a_snapshot_file(tmp_path):
+    path = tmp_path / "orbweaver.snapshot"
+    path.write_bytes(b"OWSNAP1\0" + bytes(32))
+    worker = SnapshotFile(str(path))
+    with pytest.raises(ValueError):
+        worker.read()
+    assert worker.read() is None  # Reported once
+    path.write_bytes(b"short")
+    with pytest.raises(ValueError):
+        worker.read()
+
+
+def test_sources(tmp_path):
+    collector = SnapshotFile(str(tmp_path / "orbweaver.snapshot"))
+    assert collector.read_sources() == {}
+    sources = {"a:50051": {"updated": 1000.5, "expired": False, "lsas": 100, "streaming": True}}
+    collector.write_sources(sources)
+    assert SnapshotFile(collector.filename).read_sources() == sources
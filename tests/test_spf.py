@@ -0,0 +1,69 @@
+"""ShortestPathTree.repair() against Dijkstra from scratch, on random topologies and changes"""
+import os
+import random
+import sys
+import networkx as nx
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "orbweaver"))
+from bgp_ls_vis.spf import ShortestPathTree  # pylint: disable=wrong-import-position
+
+WEIGHT = "igpMetric"
+
+
+def random_graph(rng: random.Random) -> nx.MultiDiGraph:
+    """Up to 25 nodes, parallel links included, some of them costing 0 so that zero cost cycles
+    come up, also through the source"""
+    nodes = rng.randint(2, 25)
+    graph = nx.MultiDiGraph()
+    graph.add_nodes_from(range(nodes))
+    for _ in range(rng.randint(0, 3 * nodes)):
+        local, remote = rng.randrange(nodes), rng.randrange(nodes)
+        if local != remote:
+            graph.add_edge(local, remote, **{WEIGHT: rng.randint(0, 5)})
+    return graph
+
+
+def random_change(rng: random.Random, graph: nx.MultiDiGraph) -> tuple:
+    """Copy of graph with a few links re-weighted, removed or added, and (local, remote) of each"""
+    graph = graph.copy()
+    links = set()
+    for _ in range(rng.randint(1, 4)):
+        edges = list(graph.edges(keys=True))
+        operation = rng.random()
+        if operation < 0.4 and edges:
+            local, remote, key = rng.choice(edges)
+            graph[local][remote][key][WEIGHT] = rng.randint(0, 5)
+        elif operation < 0.7 and edges:
+            local, remote, key = rng.choice(edges)
+            graph.remove_edge(local, remote, key)
+        else:
+            local, remote = rng.randrange(len(graph)), rng.randrange(len(graph))
+            if local == remote:
+                continue
+            graph.add_edge(local, remote, **{WEIGHT: rng.randint(0, 5)})
+        links.add((local, remote))
+    return graph, links
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_repair_matches_compute(seed: int):
+    rng = random.Random(seed)
+    for _ in range(40):
+        graph = random_graph(rng)
+        source = rng.randrange(len(graph))
+        tree = ShortestPathTree.compute(graph, source, WEIGHT)
+        # Trees are repaired from repaired trees, as SPFCache does it generation after generation
+        for _ in range(5):
+            graph, links = random_change(rng, graph)
+            tree = tree.repair(graph, links)
+            expected = ShortestPathTree.compute(graph, source, WEIGHT)
+
+            assert tree.distances == expected.distances
+            assert {node: sorted(preds) for node, preds in tree.predecessors.items()} == {
+                node: sorted(preds) for node, preds in expected.predecessors.items()
+            }
+            for target in expected.distances:
+                path = tree.path_to(target)
+                assert path[0] == source and path[-1] == target
+                assert nx.path_weight(graph, path, WEIGHT) == expected.distances[target]